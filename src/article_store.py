@@ -0,0 +1,220 @@
+import json
+import sqlite3
+from os import path, listdir, makedirs, remove, getpid
+
+
+# Backend used for writing articles: "files" (one json file per article) or "sqlite" (single packed file)
+# Readers detect the backend of an existing store automatically
+ARTICLE_STORE_BACKEND = "files"
+
+SQLITE_STORE_FILENAME = "articles.sqlite"
+
+# Number of written articles after which the sqlite store is committed
+SQLITE_COMMIT_INTERVAL = 1000
+
+# Open sqlite connections per (process, store)
+_connections = {}
+_pending_writes = {}
+
+
+def _is_sqlite_store(article_path):
+    """
+    Check whether the store in the given folder is a packed sqlite store
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :return: True if articles are stored in sqlite
+    :rtype: bool
+    """
+    return path.exists(path.join(article_path, SQLITE_STORE_FILENAME))
+
+
+def _get_connection(article_path):
+    """
+    Get (and create if necessary) the sqlite connection for a given store
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :return: connection to the store
+    :rtype: sqlite3.Connection
+    """
+    key = (getpid(), article_path)
+    if key not in _connections:
+        makedirs(article_path, exist_ok=True)
+        connection = sqlite3.connect(path.join(article_path, SQLITE_STORE_FILENAME))
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS articles ("
+                           "cleaned_title TEXT PRIMARY KEY, "
+                           "title TEXT, "
+                           "empty INTEGER NOT NULL DEFAULT 0, "
+                           "data TEXT NOT NULL)")
+        _connections[key] = connection
+        _pending_writes[key] = 0
+    return _connections[key]
+
+
+def store_article(article_path, info, empty=False):
+    """
+    Store an article (replacing any older version of it)
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :param info: article information dict
+    :type info: dict[str]
+    :param empty: the article has no usable sections (will be stored separately)
+    :type empty: bool
+    """
+    if ARTICLE_STORE_BACKEND == "sqlite":
+        connection = _get_connection(article_path)
+        connection.execute("INSERT OR REPLACE INTO articles (cleaned_title, title, empty, data) VALUES (?, ?, ?, ?)",
+                           (info["cleaned_title"], info["title"], int(empty), json.dumps(info)))
+        key = (getpid(), article_path)
+        _pending_writes[key] += 1
+        if _pending_writes[key] >= SQLITE_COMMIT_INTERVAL:
+            connection.commit()
+            _pending_writes[key] = 0
+        return
+
+    filename = info["cleaned_title"] + ".json"
+    if empty:
+        # Empty articles are kept in a subfolder
+        makedirs(path.join(article_path, "empty"), exist_ok=True)
+        with open(path.join(article_path, "empty", filename), "w") as article_json_file:
+            json.dump(info, article_json_file, indent=2)
+        if path.exists(path.join(article_path, filename)):
+            remove(path.join(article_path, filename))
+    else:
+        with open(path.join(article_path, filename), "w") as article_json_file:
+            json.dump(info, article_json_file, indent=2)
+        if path.exists(path.join(article_path, "empty", filename)):
+            remove(path.join(article_path, "empty", filename))
+
+
+def load_article(article_path, cleaned_title):
+    """
+    Load an article by its cleaned title
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :param cleaned_title: cleaned title of the article
+    :type cleaned_title: str
+    :return: article information dict (None if there is no such (non-empty) article)
+    :rtype: dict[str]
+    """
+    if _is_sqlite_store(article_path):
+        row = _get_connection(article_path).execute(
+            "SELECT data FROM articles WHERE cleaned_title = ? AND empty = 0", (cleaned_title,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    try:
+        with open(path.join(article_path, cleaned_title + ".json"), "r") as article_json_file:
+            return json.load(article_json_file)
+    except FileNotFoundError:
+        return None
+
+
+def remove_article(article_path, cleaned_title):
+    """
+    Remove an article (and its empty version) from the store
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :param cleaned_title: cleaned title of the article
+    :type cleaned_title: str
+    """
+    if _is_sqlite_store(article_path):
+        _get_connection(article_path).execute("DELETE FROM articles WHERE cleaned_title = ?", (cleaned_title,))
+        return
+
+    for filename in [path.join(article_path, cleaned_title + ".json"),
+                     path.join(article_path, "empty", cleaned_title + ".json")]:
+        if path.exists(filename):
+            remove(filename)
+
+
+def list_articles(article_path):
+    """
+    List the cleaned titles of all (non-empty) articles in the store
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :return: list of cleaned titles
+    :rtype: list[str]
+    """
+    if _is_sqlite_store(article_path):
+        return [row[0] for row in _get_connection(article_path).execute(
+            "SELECT cleaned_title FROM articles WHERE empty = 0 ORDER BY rowid")]
+
+    return [file[:-5] for file in listdir(article_path) if file.endswith(".json")]
+
+
+def count_articles(article_path):
+    """
+    Count all (non-empty) articles in the store
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :return: number of articles
+    :rtype: int
+    """
+    if _is_sqlite_store(article_path):
+        return _get_connection(article_path).execute("SELECT COUNT(*) FROM articles WHERE empty = 0").fetchone()[0]
+
+    return len(list_articles(article_path))
+
+
+def iter_stored_articles(article_path):
+    """
+    Iterate sequentially over all (non-empty) articles in the store
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :return: generator of article information dicts
+    :rtype: Iterator[dict[str]]
+    """
+    if _is_sqlite_store(article_path):
+        # Use a separate cursor, so that the store can be used for lookups while iterating
+        for row in _get_connection(article_path).cursor().execute(
+                "SELECT data FROM articles WHERE empty = 0 ORDER BY rowid"):
+            yield json.loads(row[0])
+        return
+
+    for cleaned_title in list_articles(article_path):
+        with open(path.join(article_path, cleaned_title + ".json"), "r") as article_json_file:
+            yield json.load(article_json_file)
+
+
+def get_store_modification_time(article_path):
+    """
+    Get the time of the last change of the store (e.g., to check whether data derived from it is outdated)
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :return: modification time in seconds since the epoch (0 if the store does not exist)
+    :rtype: float
+    """
+    if _is_sqlite_store(article_path):
+        filenames = [path.join(article_path, SQLITE_STORE_FILENAME + suffix) for suffix in ["", "-wal"]]
+    elif path.exists(article_path):
+        # Adding or removing an article changes the modification time of its folder
+        filenames = [article_path, path.join(article_path, "empty")] + \
+                    [path.join(article_path, cleaned_title + ".json") for cleaned_title in list_articles(article_path)]
+    else:
+        filenames = []
+    return max((path.getmtime(filename) for filename in filenames if path.exists(filename)), default=0)
+
+
+def close_store(article_path):
+    """
+    Commit pending writes and close the connection to the store (no-op for the files backend)
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    """
+    key = (getpid(), article_path)
+    if key in _connections:
+        _connections[key].commit()
+        _connections[key].close()
+        del _connections[key]
+        del _pending_writes[key]
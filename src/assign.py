@@ -2,15 +2,27 @@ import json
 import math
 import sys
 import logging
+from hashlib import blake2b
+import random
+from itertools import repeat
+from multiprocessing import Pool
 from os import path, makedirs
 
 import nltk
-from nltk import sent_tokenize, word_tokenize, pos_tag
+import numpy as np
+from nltk import sent_tokenize, word_tokenize, pos_tag_sents
 
+from bigram_index import BigramIndex, get_index_entry
+from cache import LRUCache
+from packed_corpus import PackedCorpusWriter, get_packed_path
+from parallel import imap_bounded
 from overlap import recreate_text_concept_based, convert_preprocessed_text, generate_concept_weights, \
-    recreate_text_sentence_based
-from parse_dump import get_article_jsons, DATA_PATH, get_clean_filename, get_article_text, \
-    get_base_path
+    recreate_text_sentence_based, CONCEPT_BASED_MODE
+from article_store import get_store_modification_time
+from parse_dump import iter_article_jsons, get_article_names, DATA_PATH, get_clean_filename, get_article_text, \
+    get_base_path, get_article_json, get_article_sentences, get_article_path
+from profiling import add_time, collect, count, timer
+from topic_index import TopicIndexWriter, get_topic_index_path
 
 
 MIN_TARGET_LENGTH = 150
@@ -20,8 +32,53 @@ TARGET_SOURCE_RATIO = 2
 MIN_SOURCE_DOC_COUNT = 5
 MIN_OVERLAP = 50
 
+# Memory budget (approximately, in bytes) for source documents (texts and tokens) kept in memory while assigning
+# (per process when using multiple workers)
+SOURCE_CACHE_SIZE = 512 * 1024 * 1024
 
-def _compute_overlap(target_text, source_text_unified_tokens, language):
+# Memory budget (approximately, in bytes) for POS tags of single sentences kept in memory (per process), so sentences
+# shared by multiple documents or tagged before their document was evicted are not tagged again
+TAG_CACHE_SIZE = 64 * 1024 * 1024
+
+# Number of processes evaluating candidate sections (tokenization, overlap and ILPs)
+ASSIGN_WORKERS = 1
+
+# Warm-start the solver of the concept-based labels with the sentence-based labels (off, since it does not pay off:
+# with CBC it made the solves of real candidates more than twice as slow, with HiGHS it makes no difference, see
+# "python benchmark.py warmstart")
+WARM_START_CONCEPT_BASED = False
+
+# Format of the inputs (and a copy of the labels) of the candidates: "json" (one file per candidate in inputs/),
+# "packed" (a single packed corpus in packed/, see packed_corpus.py) or "both" (the labels are always written as json)
+INPUTS_FORMAT = "json"
+
+# Share of the candidates whose concept-based labels are also solved exactly when approximating them (to report the
+# gap of the approximation)
+GAP_SAMPLE_RATE = 0.05
+
+# Skip candidate sections whose overlap estimated from the bigram index of all articles is clearly too low
+# before loading their source documents
+BIGRAM_PREFILTER = True
+# Tolerance (in percentage points) of the estimate, since the joined source text may be tokenized differently
+# around the borders of the documents than the single ones
+BIGRAM_PREFILTER_MARGIN = 5
+
+
+def _encode_tokens(tokens, vocabulary):
+    """
+    Map the given tokens to their integer ids in a vocabulary
+
+    :param tokens: tokens of a text
+    :type tokens: list[str]
+    :param vocabulary: ids of the known tokens
+    :type vocabulary: dict[str, int]
+    :return: token ids (-1 for unknown tokens)
+    :rtype: np.ndarray
+    """
+    return np.fromiter(map(vocabulary.get, tokens, repeat(-1)), dtype=np.int64, count=len(tokens))
+
+
+def _compute_overlap(target_text, source_text_unified_tokens, language, target_text_tokens=None):
     """
     Compute bigram overlap between two given texts
 
@@ -31,57 +88,605 @@ def _compute_overlap(target_text, source_text_unified_tokens, language):
     :type source_text_unified_tokens: list[str]
     :param language: language of the two texts
     :type language: str
+    :param target_text_tokens: tokens of the first text (if already present)
+    :type target_text_tokens: list[str]
     :return: percentage of bigram overlap between the given texts
     :rtype: float
     """
     # Compute bigram overlap
-    target_text_tokens = nltk.word_tokenize(target_text, language)
-    bigrams_target = nltk.bigrams(target_text_tokens)
-    bigrams_source = set(nltk.bigrams(source_text_unified_tokens))
-    bigrams_found_not_found = [1 if bigram in bigrams_source else 0 for bigram in bigrams_target]
-    return sum(bigrams_found_not_found) / float(len(bigrams_found_not_found)) * 100
+    if target_text_tokens is None:
+        target_text_tokens = nltk.word_tokenize(target_text, language)
+
+    # Only bigrams made of tokens of the (short) target text matter, so the tokens are mapped to ids in the
+    # vocabulary of the target and each bigram is encoded as an integer (first id * vocabulary size + second id)
+    vocabulary = {}
+    for token in target_text_tokens:
+        vocabulary.setdefault(token, len(vocabulary))
+    vocabulary_size = len(vocabulary)
+    target_ids = _encode_tokens(target_text_tokens, vocabulary)
+    source_ids = _encode_tokens(source_text_unified_tokens, vocabulary)
+
+    # Mark all bigrams of the source (with tokens of the target) in a table of all possible bigram codes
+    known = (source_ids[:-1] >= 0) & (source_ids[1:] >= 0)
+    bigrams_source = np.zeros(vocabulary_size * vocabulary_size, dtype=bool)
+    bigrams_source[source_ids[:-1][known] * vocabulary_size + source_ids[1:][known]] = True
+
+    bigrams_found = bigrams_source[target_ids[:-1] * vocabulary_size + target_ids[1:]]
+    return int(bigrams_found.sum()) / float(len(bigrams_found)) * 100
+
+
+def _load_source_document(article_name, wiki_name, language):
+    """
+    Load text and (if stored by the parser) tokenized sentences of a given source document
+
+    :param article_name: name of the article
+    :type article_name: str
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param language: language of this wiki
+    :type language: str
+    :return: source document dict (see _make_source_document)
+    :rtype: dict[str]
+    """
+    with timer("io"):
+        article_info = get_article_json(article_name, wiki_name)
+    return _make_source_document(article_name, wiki_name, language, article_info)
+
+
+def _make_source_document(article_name, wiki_name, language, article_info):
+    """
+    Get text and (if stored by the parser) tokenized sentences of a given loaded article
+
+    The tokens of the text are taken from the stored sentences or tokenized like nltk.word_tokenize would do it (the
+    first and last sentence are kept to check whether the tokens of multiple documents can be joined, see
+    _join_source_tokens).
+
+    :param article_name: name of the article
+    :type article_name: str
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param language: language of this wiki
+    :type language: str
+    :param article_info: article information dict (None if the article does not exist)
+    :type article_info: dict[str]
+    :return: source document dict with text, stored sentences (None if no tokens are stored), tokens and
+             (so far uncomputed) sentences for the input representation
+    :rtype: dict[str]
+    """
+    document = {
+        "text": get_article_text(article_name, wiki_name, article_info) if article_info is not None else "",
+        "sentences": get_article_sentences(article_info),
+        "tokens": None,
+        "input_sentences": None,
+    }
+
+    if document["text"].strip() == "":
+        return document
+    if document["sentences"] is not None:
+        sentence_tokens = [(sent, tokens) for sent, tokens, _ in document["sentences"]]
+    else:
+        with timer("tokenization"):
+            sentence_tokens = [(sent, word_tokenize(sent, language, preserve_line=True)) for sent in sent_tokenize(document["text"], language)]
+    document["tokens"] = [token for _, tokens in sentence_tokens for token in tokens]
+    document["first_sentence"] = sentence_tokens[0]
+    document["last_sentence"] = sentence_tokens[-1]
+    return document
 
 
-def assign(wiki_name, experiment='qf-mds', language="english"):
+def _get_document_size(document):
+    """
+    Estimate the memory used by a loaded source document
+
+    :param document: source document dict (see _load_source_document)
+    :type document: dict[str]
+    :return: approximate size in bytes
+    :rtype: int
+    """
+    size = sys.getsizeof(document["text"])
+    if document["tokens"] is not None:
+        size += sum(sys.getsizeof(token) + 8 for token in document["tokens"])
+    for sentences in [document["sentences"], document["input_sentences"]]:
+        if sentences is not None:
+            for sent, tokens, tagged_sent in sentences:
+                size += sys.getsizeof(sent) + sum(sys.getsizeof(token) + 8 for token in tokens)
+                if tagged_sent is not None:
+                    # Tuples of tokens and (shared) tags
+                    size += 72 * len(tagged_sent)
+    return size
+
+
+def _get_source_document(article_name, wiki_name, language, source_cache):
+    """
+    Get a source document from the cache or load it
+
+    :param article_name: name of the article
+    :type article_name: str
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param language: language of this wiki
+    :type language: str
+    :param source_cache: cache of loaded source documents
+    :type source_cache: cache.LRUCache
+    :return: source document dict (see _load_source_document)
+    :rtype: dict[str]
+    """
+    document = source_cache.get(article_name)
+    if document is None:
+        document = _load_source_document(article_name, wiki_name, language)
+        source_cache.put(article_name, document, _get_document_size(document))
+    return document
+
+
+def _join_source_tokens(documents, language):
+    """
+    Get the tokens of the joined texts of the given source documents
+
+    :param documents: source document dicts (see _load_source_document)
+    :type documents: list[dict[str]]
+    :param language: language of this wiki
+    :type language: str
+    :return: tokens of all documents
+    :rtype: list[str]
+    """
+    documents = [document for document in documents if document["text"].strip() != '']
+
+    # Tokenizing the documents separately gives the same tokens as tokenizing the joined text (as done before)
+    # if the sentence tokenizer splits between all neighbouring documents
+    if all(document["tokens"] is not None for document in documents) \
+            and all(word_tokenize(previous["last_sentence"][0] + "\n" + following["first_sentence"][0], language) == previous["last_sentence"][1] + following["first_sentence"][1]
+                    for previous, following in zip(documents, documents[1:])):
+        return [token for document in documents for token in document["tokens"]]
+
+    return nltk.word_tokenize("\n".join(document["text"] for document in documents), language=language)
+
+
+def _get_sentence_key(sentence):
+    """
+    Get the key of a sentence in the tag cache
+
+    :param sentence: text of the sentence
+    :type sentence: str
+    :return: hash of the sentence
+    :rtype: bytes
+    """
+    return blake2b(sentence.encode("utf-8"), digest_size=16).digest()
+
+
+def _add_input_sentences(documents, language, tag_cache):
+    """
+    Compute the sentences of the given source documents with tokens and POS tags for the input representation
+
+    All sentences without stored or cached POS tags are tagged in a single batch (tagging them one by one is much
+    slower, since the tagger has a high overhead per call).
+
+    :param documents: source document dicts (see _load_source_document) without input sentences, the results are
+                      stored in them (as list of (sentence, tokens, POS tags) tuples)
+    :type documents: list[dict[str]]
+    :param language: language of this wiki
+    :type language: str
+    :param tag_cache: cache of the POS tags of single sentences
+    :type tag_cache: cache.LRUCache
+    :return: number of sentences tagged and taken from the cache
+    :rtype: tuple[int, int]
+    """
+    untagged = []
+    cache_hits = 0
+    for document in documents:
+        sentences = document["sentences"]
+        if sentences is None:
+            sentences = [(sent, word_tokenize(sent, language), None) for sent in sent_tokenize(document["text"])]
+        input_sentences = []
+        for sent, tokenized_sent, tagged_sent in sentences:
+            if tagged_sent is None:
+                cached = tag_cache.get(_get_sentence_key(sent))
+                # The tags are only valid for the same tokens
+                if cached is not None and [token for token, _ in cached] == tokenized_sent:
+                    tagged_sent = cached
+                    cache_hits += 1
+                else:
+                    untagged.append((len(input_sentences), input_sentences))
+            input_sentences.append((sent, tokenized_sent, tagged_sent))
+        document["input_sentences"] = input_sentences
+
+    if not untagged:
+        return 0, cache_hits
+
+    # The short language is passed as tagset like the original per-sentence pos_tag call, to keep the tags written to
+    # the inputs unchanged
+    tagged_sents = pos_tag_sents([input_sentences[i][1] for i, input_sentences in untagged], language[:3])
+    for (i, input_sentences), tagged_sent in zip(untagged, tagged_sents):
+        sent, tokenized_sent, _ = input_sentences[i]
+        input_sentences[i] = (sent, tokenized_sent, tagged_sent)
+        tag_cache.put(_get_sentence_key(sent), tagged_sent, 72 * len(tagged_sent) + sum(sys.getsizeof(token) for token in tokenized_sent))
+    return len(untagged), cache_hits
+
+
+def _iter_candidate_sections(wiki_name, unwanted_categories):
+    """
+    Iterate over all sections meeting the length and source document heuristics
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param unwanted_categories: categories of articles to ignore
+    :type unwanted_categories: set[str]
+    :return: generator of candidate dicts (query, target text, length and tokens and source document names)
+    :rtype: Iterator[dict[str]]
+    """
+    # Loop over all articles
+    for article_info in iter_article_jsons(wiki_name):
+        count("articles")
+        if "sections" not in article_info:
+            continue
+
+        # Consider only articles with multiple sections (since the first one is not query-focused)
+        if len(article_info["sections"]) > 1:
+            # Skip all stub articles and articles from unwanted categories
+            if any(True for category in article_info["categories"] if "stub" in category.lower() or category in unwanted_categories):
+                logging.info(f"Ingore {article_info['title']} because of categories: {', '.join(article_info['categories'])}")
+                continue
+
+            for section in article_info["sections"][1:]:
+                count("sections")
+                # Suitable sections need to have a certain length and enough source docs
+                target_length = section["length"]
+
+                # Clean links (remove-self references and section restrictions)
+                cleaned_source_doc_names = set(get_clean_filename(link.split('#')[0]) for link in section["links"] if not link.startswith('#'))
+                cleaned_source_doc_names = cleaned_source_doc_names.difference([article_info["cleaned_title"]])
+                source_doc_count = len(cleaned_source_doc_names)
+
+                # Check if section meets heuristic
+                if MIN_TARGET_LENGTH <= target_length <= MAX_TARGET_LENGTH and source_doc_count >= MIN_SOURCE_DOC_COUNT:
+                    count("candidates_checked")
+                    yield {
+                        "query": f"{article_info['title']}: {section['title']}",
+                        "target_text": section["text"],
+                        "target_length": target_length,
+                        "target_tokens": section.get("word_tokens"),
+                        # Fix the order of the source documents (a set might be iterated differently in a worker process)
+                        "source_doc_names": list(cleaned_source_doc_names),
+                    }
+
+
+# Settings and state of the current assign worker process
+_worker_wiki_name = None
+_worker_language = None
+_worker_stopword_set = None
+_worker_source_cache = None
+_worker_tag_cache = None
+_worker_concept_based_mode = None
+
+
+def _init_assign_worker(wiki_name, language, concept_based_mode=CONCEPT_BASED_MODE):
+    """
+    Initialize a process for evaluating candidate sections
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param language: language of this wiki
+    :type language: str
+    :param concept_based_mode: mode of the concept-based labels (see overlap.CONCEPT_BASED_MODE)
+    :type concept_based_mode: str
+    """
+    global _worker_wiki_name, _worker_language, _worker_stopword_set, _worker_source_cache, _worker_tag_cache, \
+        _worker_concept_based_mode
+    _worker_wiki_name = wiki_name
+    _worker_language = language
+    _worker_concept_based_mode = concept_based_mode
+    _worker_stopword_set = set(sw.lower() for sw in nltk.corpus.stopwords.words(language))
+    # Popular articles are source documents of many sections, keep them in memory
+    _worker_source_cache = LRUCache(SOURCE_CACHE_SIZE)
+    _worker_tag_cache = LRUCache(TAG_CACHE_SIZE)
+
+
+def _get_index_entry(article_info):
+    """
+    Compute the bigram index entry of an article (with the tokens used when it is a source document)
+
+    :param article_info: article information dict
+    :type article_info: dict[str]
+    :return: article name and index entry (see bigram_index.get_index_entry), None if the article has no text
+    :rtype: tuple[str, tuple]
+    """
+    article_name = article_info["cleaned_title"]
+    document = _make_source_document(article_name, _worker_wiki_name, _worker_language, article_info)
+    if document["text"] == "":
+        return None
+    return article_name, get_index_entry(document["tokens"] if document["tokens"] is not None else [])
+
+
+def _get_bigram_index(wiki_name, language, pool):
+    """
+    Load the bigram index of all articles of a wiki or (re)build it if it is missing or older than the article store
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param language: language of this wiki
+    :type language: str
+    :param pool: pool of worker processes (see _init_assign_worker) for computing the entries, None to compute them
+                 in this process
+    :type pool: multiprocessing.pool.Pool
+    :return: bigram index of all articles with text
+    :rtype: BigramIndex
+    """
+    index_path = path.join(get_base_path(wiki_name), f"bigram_index.{language}.npz")
+    if path.exists(index_path) and path.getmtime(index_path) >= get_store_modification_time(get_article_path(wiki_name)):
+        with timer("io"):
+            bigram_index = BigramIndex.load(index_path)
+        if bigram_index is not None:
+            return bigram_index
+
+    print("Building bigram index...")
+    with timer("bigram_index"):
+        articles = iter_article_jsons(wiki_name)
+        if pool is not None:
+            entries = imap_bounded(pool, _get_index_entry, articles, chunk_size=64)
+        else:
+            entries = map(_get_index_entry, articles)
+        bigram_index = BigramIndex.build(entry for entry in entries if entry is not None)
+        bigram_index.save(index_path)
+    count("bigram_index_articles", len(bigram_index))
+    return bigram_index
+
+
+def _prefilter_candidates(candidates, bigram_index, language):
+    """
+    Skip all candidate sections that cannot meet the source document count or overlap criterion according to the
+    bigram index (without loading their source documents)
+
+    :param candidates: candidate dicts (see _iter_candidate_sections)
+    :type candidates: Iterable[dict[str]]
+    :param bigram_index: bigram index of all articles of the wiki
+    :type bigram_index: BigramIndex
+    :param language: language of this wiki
+    :type language: str
+    :return: generator of the remaining candidate dicts (with target tokens)
+    :rtype: Iterator[dict[str]]
+    """
+    for candidate in candidates:
+        with timer("prefilter"):
+            # Articles with text are exactly the indexed ones
+            if sum(1 for article in candidate["source_doc_names"] if article in bigram_index) < MIN_SOURCE_DOC_COUNT:
+                count("candidates_prefiltered")
+                continue
+
+            if candidate["target_tokens"] is None:
+                candidate["target_tokens"] = nltk.word_tokenize(candidate["target_text"], language)
+            if bigram_index.estimate_overlap(candidate["target_tokens"], candidate["source_doc_names"]) < MIN_OVERLAP - BIGRAM_PREFILTER_MARGIN:
+                count("candidates_prefiltered")
+                continue
+        yield candidate
+
+
+def _evaluate_candidate(candidate):
+    """
+    Evaluate a candidate section (see _compute_candidate)
+
+    Counters and timers are returned instead of recorded, since this might run in a worker process.
+
+    :param candidate: candidate dict (see _iter_candidate_sections)
+    :type candidate: dict[str]
+    :return: result dict (None if the candidate is not suitable), counters and timers of this evaluation
+    :rtype: tuple[dict[str], dict[str, int], dict[str, float]]
+    """
+    with collect() as collected:
+        result, statistics = _compute_candidate(candidate)
+    for name, value in collected["counters"].items():
+        statistics[name] = statistics.get(name, 0) + value
+    return result, statistics, collected["timers"]
+
+
+def _compute_candidate(candidate):
+    """
+    Compute the overlap of a candidate section with the source documents and, if it is high enough, the input
+    representation and the extractive summaries (labels)
+
+    :param candidate: candidate dict (see _iter_candidate_sections)
+    :type candidate: dict[str]
+    :return: result dict (None if the candidate is not suitable) and statistics of this evaluation
+    :rtype: tuple[dict[str], dict[str, int]]
+    """
+    wiki_name, language, stopword_set, source_cache = _worker_wiki_name, _worker_language, _worker_stopword_set, _worker_source_cache
+    cache_statistics = source_cache.get_statistics()
+    statistics = {}
+
+    def get_statistics():
+        for name, value in source_cache.get_statistics().items():
+            if name in ["hits", "misses", "evictions"]:
+                statistics[f"source_cache_{name}"] = value - cache_statistics[name]
+        return statistics
+
+    # Get source text for further analyzing
+    source_documents = [(article, _get_source_document(article, wiki_name, language, source_cache)) for article in candidate["source_doc_names"]]
+    source_documents = [(article, document) for article, document in source_documents if document["text"] != '']
+    source_doc_count = len(source_documents)
+    statistics["source_documents"] = source_doc_count
+
+    # Make sure that source doc count criterion is still met now that we tried to load the source docs
+    if source_doc_count < MIN_SOURCE_DOC_COUNT:
+        return None, get_statistics()
+
+    with timer("tokenization"):
+        source_text_unified_tokens = _join_source_tokens([document for _, document in source_documents], language)
+    statistics["source_tokens"] = len(source_text_unified_tokens)
+
+    # Compute bigram overlap
+    target_text = candidate["target_text"]
+    with timer("overlap"):
+        target_source_overlap = _compute_overlap(target_text, source_text_unified_tokens, language, candidate["target_tokens"])
+
+    # Ignore possible summaries with very little overlap
+    if target_source_overlap < MIN_OVERLAP:
+        return None, get_statistics()
+
+    # Generate input representation
+    inputs = []
+    sent_id = 0
+    with timer("tokenization"):
+        untagged_documents = [(article, document) for article, document in source_documents if document["input_sentences"] is None]
+        statistics["tagged_sentences"], statistics["tag_cache_hits"] = _add_input_sentences(
+            [document for _, document in untagged_documents], language, _worker_tag_cache)
+        for article, document in untagged_documents:
+            # Update the size of the cached document
+            source_cache.put(article, document, _get_document_size(document))
+
+        for doc_id, (article, document) in enumerate(source_documents):
+            for sent, tokenized_sent, tagged_sent in document["input_sentences"]:
+                sent_info = {
+                    "text": sent,
+                    "tokens": tokenized_sent,
+                    "pos": tagged_sent,
+                    "doc_id": doc_id,
+                    "sentence_id": sent_id,
+                    "word_count": len(tokenized_sent)
+                }
+                inputs.append(sent_info)
+                sent_id += 1
+
+    with timer("tokenization"):
+        # Concepts are interned as integer ids, source bigrams that are no concept of the target text are left out
+        concept_ids = {}
+        concept_weights = generate_concept_weights(target_text, stopword_set, concept_ids)
+        source_text_processed = convert_preprocessed_text(inputs, stopword_set, concept_ids)
+
+    # Generate labels sentence based...
+    with timer("ilp"):
+        sentence_based = recreate_text_sentence_based(source_text_processed, concept_weights, TARGET_LENGTH_EXTRACTIVE)
+
+    # ... and concept based (starting from the sentence-based solution, which is feasible for it)
+    initial_labels = sentence_based[0] if WARM_START_CONCEPT_BASED else None
+    with timer("ilp"):
+        concept_based = recreate_text_concept_based(source_text_processed, concept_weights, TARGET_LENGTH_EXTRACTIVE,
+                                                    initial_labels, _worker_concept_based_mode)
+
+    # Solve a sample of the approximated candidates exactly (chosen by query, so independent of the workers)
+    if _worker_concept_based_mode != "exact" and random.Random(candidate["query"]).random() < GAP_SAMPLE_RATE:
+        with timer("ilp"):
+            exact_concept_based = recreate_text_concept_based(source_text_processed, concept_weights, TARGET_LENGTH_EXTRACTIVE,
+                                                              initial_labels, "exact")
+        if exact_concept_based[1] is not None:
+            statistics["concept_based_gap_samples"] = 1
+            statistics["concept_based_approximate_score"] = concept_based[1]
+            statistics["concept_based_exact_score"] = exact_concept_based[1]
+
+    return {
+        "query": candidate["query"],
+        "target_text": target_text,
+        "target_length": candidate["target_length"],
+        "overlap": target_source_overlap,
+        "source_doc_count": source_doc_count,
+        "source_overall_length": len(source_text_unified_tokens),
+        "source_doc_names": [article for article, _ in source_documents],
+        "inputs": inputs,
+        "concept_based": concept_based,
+        "sentence_based": sentence_based,
+    }, get_statistics()
+
+
+def _write_candidate(output_prefix, result, output_paths, topic_index_writer, packed_writer=None):
+    """
+    Write all files of an accepted candidate
+
+    :param output_prefix: identifier of the candidate
+    :type output_prefix: str
+    :param result: result dict (see _evaluate_candidate)
+    :type result: dict[str]
+    :param output_paths: output folders (by kind of output), without inputs if they are only packed
+    :type output_paths: dict[str, str]
+    :param topic_index_writer: writer of the topic index
+    :type topic_index_writer: topic_index.TopicIndexWriter
+    :param packed_writer: writer of the packed corpus (None if the inputs are not packed)
+    :type packed_writer: packed_corpus.PackedCorpusWriter
+    """
+    # Output target text in new format
+    with open(path.join(output_paths["human_abstracts"], output_prefix) + ".1.txt", "w") as human_abstract_file:
+        human_abstract_file.write(result["target_text"])
+
+    input_info = {
+        "id": output_prefix,
+        "query": result["query"],
+        "target_length": result["target_length"],
+        "overlap": result["overlap"],
+        "source_doc_count": result["source_doc_count"],
+        "source_overall_length": result["source_overall_length"],
+        "source_doc_names": result["source_doc_names"],
+        "inputs": result["inputs"]
+    }
+    if "inputs" in output_paths:
+        with open(path.join(output_paths["inputs"], output_prefix) + ".json", "w") as input_file:
+            json.dump(input_info, input_file, indent=2)
+
+    labels_infos = {}
+
+    # Labels concept based and sentence based
+    for kind in ["concept_based", "sentence_based"]:
+        labels, solution_score, solution_length, solution_text = result[kind]
+        labels_info = {
+            "id": output_prefix,
+            "score": solution_score,
+            "text": solution_text,
+            "length": solution_length,
+            "labels": labels,
+        }
+        labels_infos[kind] = labels_info
+        with open(path.join(output_paths["labels_" + kind], output_prefix) + ".json", "w") as labels_file:
+            json.dump(labels_info, labels_file, indent=2)
+
+        # Store raw text of this extractive summary
+        with open(path.join(output_paths["extractive_" + kind], output_prefix) + ".1.txt", "w") as extractive_file:
+            extractive_file.write(solution_text)
+
+    topic_index_writer.add_topic(input_info, labels_infos)
+    if packed_writer is not None:
+        packed_writer.add_topic(input_info, labels_infos)
+
+
+def assign(wiki_name, experiment='qf-mds', language="english", workers=ASSIGN_WORKERS, prefilter=BIGRAM_PREFILTER,
+           concept_based_mode=CONCEPT_BASED_MODE):
     """
     Determine which articles are suitable for single document summarization
     and apply train-dev-test-split
 
+    With multiple workers, candidate sections are evaluated in parallel, but the results are numbered and written in
+    the same order as in a serial run (the timers of the evaluation are only recorded in a serial run).
+
+    With the prefilter, the overlap of each candidate section is first estimated from a precomputed index of the
+    hashed bigrams of all articles, so source documents are only loaded for promising sections.
+
+    If the concept-based labels are approximated, a sample of the candidates (see GAP_SAMPLE_RATE) is also solved
+    exactly and the gap between the approximated and optimal scores is reported.
+
     :param wiki_name: name of the wikia dump to parse
     :type wiki_name: str
     :param experiment: construct abstractive or extractive summaries (extractive will only use documents with a certain portion of sentences from source documents reused)
     :type experiment: str
     :param language: language of this wiki
     :type language: str
+    :param workers: number of processes used for evaluating candidate sections
+    :type workers: int
+    :param prefilter: skip candidate sections with too little estimated overlap (see _prefilter_candidates)
+    :type prefilter: bool
+    :param concept_based_mode: mode of the concept-based labels (see overlap.CONCEPT_BASED_MODE)
+    :type concept_based_mode: str
     """
-    language_short = language[:3]
-    stopword_set = set(sw.lower() for sw in nltk.corpus.stopwords.words(language))
-
     # Process raw files
     print("Creating Query-Focused Multi Document Summarization corpus...")
 
-    article_json_files = get_article_jsons(wiki_name)
+    article_count = len(get_article_names(wiki_name))
 
     output_path_base = path.join(DATA_PATH, wiki_name, experiment)
-    makedirs(output_path_base, exist_ok=True)
-
-    output_path_inputs = path.join(output_path_base, "inputs")
-    makedirs(output_path_inputs, exist_ok=True)
-
-    output_path_labels_concept = path.join(output_path_base, "labels-concept-based")
-    makedirs(output_path_labels_concept, exist_ok=True)
-
-    output_path_extractive_concept = path.join(output_path_base, "extractive-concept-based")
-    makedirs(output_path_extractive_concept, exist_ok=True)
-
-    output_path_labels_non_distinct = path.join(output_path_base, "labels-sentence-based")
-    makedirs(output_path_labels_non_distinct, exist_ok=True)
-
-    output_path_extractive_sentence = path.join(output_path_base, "extractive-sentence-based")
-    makedirs(output_path_extractive_sentence, exist_ok=True)
-
-    output_path_human_abstracts = path.join(output_path_base, "human-abstracts")
-    makedirs(output_path_human_abstracts, exist_ok=True)
+    output_paths = {
+        "inputs": path.join(output_path_base, "inputs"),
+        "labels_concept_based": path.join(output_path_base, "labels-concept-based"),
+        "extractive_concept_based": path.join(output_path_base, "extractive-concept-based"),
+        "labels_sentence_based": path.join(output_path_base, "labels-sentence-based"),
+        "extractive_sentence_based": path.join(output_path_base, "extractive-sentence-based"),
+        "human_abstracts": path.join(output_path_base, "human-abstracts"),
+    }
+    if INPUTS_FORMAT == "packed":
+        del output_paths["inputs"]
+    for output_path in output_paths.values():
+        makedirs(output_path, exist_ok=True)
 
     try:
         with open(path.join(get_base_path(wiki_name), wiki_name + ".json"), "r") as wiki_info_file:
@@ -91,136 +696,64 @@ def assign(wiki_name, experiment='qf-mds', language="english"):
         unwanted_categories = set()
 
     candidates_count = 0
+    cache_statistics = {"source_cache_hits": 0, "source_cache_misses": 0, "source_cache_evictions": 0}
+    gap_statistics = {"concept_based_gap_samples": 0, "concept_based_approximate_score": 0, "concept_based_exact_score": 0}
 
     # Padding for file identifiers according to the maximum number of articles
-    padding_length = math.ceil(math.log(len(article_json_files), 10))
+    padding_length = math.ceil(math.log(article_count, 10))
 
-    output_statistics = []
+    if workers > 1:
+        pool = Pool(workers, initializer=_init_assign_worker, initargs=(wiki_name, language, concept_based_mode))
+    else:
+        pool = None
+        _init_assign_worker(wiki_name, language, concept_based_mode)
 
-    # Loop over all articles
-    for article_json_filename in article_json_files:
-        with open(article_json_filename, "r") as article_json_file:
-            article_info = json.load(article_json_file)
+    topic_index_writer = TopicIndexWriter(get_topic_index_path(wiki_name, experiment))
+    packed_writer = PackedCorpusWriter(get_packed_path(wiki_name, experiment)) if INPUTS_FORMAT in ["packed", "both"] else None
 
-            if "sections" not in article_info:
+    try:
+        candidates = _iter_candidate_sections(wiki_name, unwanted_categories)
+        if prefilter:
+            candidates = _prefilter_candidates(candidates, _get_bigram_index(wiki_name, language, pool), language)
+        if pool is not None:
+            results = imap_bounded(pool, _evaluate_candidate, candidates)
+        else:
+            results = map(_evaluate_candidate, candidates)
+
+        # Results arrive in the order of the candidates, so the numbering does not depend on the number of workers
+        for result, statistics, timers in results:
+            for name, seconds in timers.items():
+                add_time(name, seconds)
+            for name, value in statistics.items():
+                count(name, value)
+                if name in cache_statistics:
+                    cache_statistics[name] += value
+                if name in gap_statistics:
+                    gap_statistics[name] += value
+            if result is None:
                 continue
 
-            # Consider only articles with multiple sections (since the first one is not query-focused)
-            if len(article_info["sections"]) > 1:
-                # Skip all stub articles and articles from unwanted categories
-                if any(True for category in article_info["categories"] if "stub" in category.lower() or category in unwanted_categories):
-                    logging.info(f"Ingore {article_info['title']} because of categories: {', '.join(article_info['categories'])}")
-                    continue
-
-                for section in article_info["sections"][1:]:
-                    # Suitable sections need to have a certain length and enough source docs
-                    target_length = section["length"]
-
-                    # Clean links (remove-self references and section restrictions)
-                    cleaned_source_doc_names = set(get_clean_filename(link.split('#')[0]) for link in section["links"] if not link.startswith('#'))
-                    cleaned_source_doc_names = cleaned_source_doc_names.difference([article_info["cleaned_title"]])
-                    source_doc_count = len(cleaned_source_doc_names)
-
-                    # Check if section meets heuristic
-                    if MIN_TARGET_LENGTH <= target_length <= MAX_TARGET_LENGTH and source_doc_count >= MIN_SOURCE_DOC_COUNT:
-                        # Target
-                        query = f"{article_info['title']}: {section['title']}"
-                        target_text = section["text"]
-
-                        # Get source text for further analyzing
-                        source_texts = [(article, get_article_text(article, wiki_name)) for article in cleaned_source_doc_names]
-                        source_texts = [(article, text) for article, text in source_texts if text != '']
-                        source_doc_count = len(source_texts)
-
-                        # Make sure that source doc count criterion is still met now that we tried to load the source docs
-                        if source_doc_count < MIN_SOURCE_DOC_COUNT:
-                            continue
-
-                        source_text_unified = "\n".join(text for _, text in source_texts if text.strip() != '')
-                        source_text_unified_tokens = nltk.word_tokenize(source_text_unified, language=language)
-
-                        # Compute bigram overlap
-                        target_source_overlap = _compute_overlap(target_text, source_text_unified_tokens, language)
-
-                        # Ignore possible summaries with very little overlap
-                        if target_source_overlap >= MIN_OVERLAP:
-                            print(f"{candidates_count}: {query} [{target_length}, {source_doc_count}, {target_source_overlap:02.4f}]")
-
-                            # Prepare output
-                            output_prefix = f"{wiki_name}_{candidates_count:0{padding_length}d}"
-
-                            # Output target text in new format
-                            with open(path.join(output_path_human_abstracts, output_prefix) + ".1.txt", "w") as human_abstract_file:
-                                human_abstract_file.write(target_text)
-
-                            # Generate input representation
-                            inputs = []
-                            sent_id = 0
-                            for doc_id, (_, text) in enumerate(source_texts):
-                                for sent in sent_tokenize(text):
-                                    tokenized_sent = word_tokenize(sent, language)
-                                    sent_info = {
-                                        "text": sent,
-                                        "tokens": tokenized_sent,
-                                        "pos": pos_tag(tokenized_sent, language_short),
-                                        "doc_id": doc_id,
-                                        "sentence_id": sent_id,
-                                        "word_count": len(tokenized_sent)
-                                    }
-                                    inputs.append(sent_info)
-                                    sent_id += 1
-
-                            input_info = {
-                                "id": output_prefix,
-                                "query": query,
-                                "target_length": target_length,
-                                "overlap": target_source_overlap,
-                                "source_doc_count": source_doc_count,
-                                "source_overall_length": len(source_text_unified_tokens),
-                                "source_doc_names": [article for article, _ in source_texts],
-                                "inputs": inputs
-                            }
-                            with open(path.join(output_path_inputs, output_prefix) + ".json", "w") as input_file:
-                                json.dump(input_info, input_file, indent=2)
-
-                            concept_weights = generate_concept_weights(target_text, stopword_set)
-                            source_text_processed = convert_preprocessed_text(inputs, stopword_set)
-
-                            # Generate labels concept based...
-                            labels, solution_score, solution_length, solution_text = recreate_text_concept_based(source_text_processed, concept_weights, TARGET_LENGTH_EXTRACTIVE)
-                            labels_info = {
-                                "id": output_prefix,
-                                "score": solution_score,
-                                "text": solution_text,
-                                "length": solution_length,
-                                "labels": labels,
-                            }
-                            with open(path.join(output_path_labels_concept, output_prefix) + ".json", "w") as labels_file:
-                                json.dump(labels_info, labels_file, indent=2)
-
-                            # Store raw text of this extractive summary
-                            with open(path.join(output_path_extractive_concept, output_prefix) + ".1.txt", "w") as extractive_file:
-                                extractive_file.write(solution_text)
-
-                            # ... and sentence based
-                            labels, solution_score, solution_length, solution_text = recreate_text_sentence_based(source_text_processed, concept_weights, TARGET_LENGTH_EXTRACTIVE)
-                            labels_info = {
-                                "id": output_prefix,
-                                "score": solution_score,
-                                "text": solution_text,
-                                "length": solution_length,
-                                "labels": labels,
-                            }
-                            with open(path.join(output_path_labels_non_distinct, output_prefix) + ".json", "w") as labels_file:
-                                json.dump(labels_info, labels_file, indent=2)
-
-                            # Store raw text of this extractive summary
-                            with open(path.join(output_path_extractive_sentence, output_prefix) + ".1.txt", "w") as extractive_file:
-                                extractive_file.write(solution_text)
-
-                            candidates_count += 1
+            print(f"{candidates_count}: {result['query']} [{result['target_length']}, {result['source_doc_count']}, {result['overlap']:02.4f}]")
+
+            # Prepare output
+            output_prefix = f"{wiki_name}_{candidates_count:0{padding_length}d}"
+            with timer("io"):
+                _write_candidate(output_prefix, result, output_paths, topic_index_writer, packed_writer)
+
+            candidates_count += 1
+            count("candidates")
+    finally:
+        if pool is not None:
+            pool.terminate()
+        topic_index_writer.close()
+        if packed_writer is not None:
+            packed_writer.close()
 
     print(f"Created {candidates_count} query-focused multi document summaries")
+    print(f"Source document cache: {cache_statistics['source_cache_hits']} hits, {cache_statistics['source_cache_misses']} misses, {cache_statistics['source_cache_evictions']} evictions")
+    if gap_statistics["concept_based_gap_samples"] > 0:
+        gap = 1 - gap_statistics["concept_based_approximate_score"] / gap_statistics["concept_based_exact_score"] if gap_statistics["concept_based_exact_score"] > 0 else 0
+        print(f"Concept-based labels ({concept_based_mode}): {gap * 100:.2f}% below the optimal score on {gap_statistics['concept_based_gap_samples']} exactly solved candidates")
 
 
 if __name__ == "__main__":
@@ -233,5 +766,13 @@ if __name__ == "__main__":
         language = sys.argv[3]
     else:
         language = "english"
+    if len(sys.argv) > 4:
+        workers = int(sys.argv[4])
+    else:
+        workers = ASSIGN_WORKERS
+    if len(sys.argv) > 5:
+        concept_based_mode = sys.argv[5]
+    else:
+        concept_based_mode = CONCEPT_BASED_MODE
 
-    assign(wiki_name, experiment, language)
+    assign(wiki_name, experiment, language, workers, concept_based_mode=concept_based_mode)
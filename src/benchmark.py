@@ -0,0 +1,491 @@
+import contextlib
+import html
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from itertools import islice
+
+import nltk
+import pulp
+import wikitextparser as wtp
+
+from assign import _compute_overlap
+import overlap
+import solver
+from overlap import _build_concept_based_problem, recreate_text_concept_based, recreate_text_sentence_based
+from parse_dump import iter_articles, get_dump_path, adapt_ignores, compile_ignores, parse_article, \
+    comment_cleaner, TEXT_CLEAN_SECTIONS_IGNORE, BAD_SENTENCE_PREFIXES, _clean_sections_wtp, _clean_sections_spans
+
+
+def _parse_article_reference(info, ignores, language='english'):
+    """
+    Reference implementation of the article parsing (cleaning engine as before the optimizations)
+
+    :param info: article information dict (with raw text)
+    :type info: dict[str]
+    :param ignores: links to ignore (prefixes)
+    :type ignores: list[str]
+    :param language: language of this wiki
+    :type language: str
+    :return: the given article information dict
+    :rtype: dict[str]
+    """
+    parsed_text = wtp.parse(comment_cleaner.sub("", info['raw_text']))
+    info["categories"] = [wl.target[9:] for wl in parsed_text.wikilinks if wl.target.startswith("Category")]
+
+    parsed_sections = []
+    for section in parsed_text.sections:
+        if section.title not in TEXT_CLEAN_SECTIONS_IGNORE and section.contents != "":
+            section_links = list(set(wl.target for wl in section.wikilinks if all(not(wl.target.startswith(s)) for s in ignores)))
+
+            for template in section.templates:
+                try:
+                    del template[:]
+                except IndexError:
+                    pass
+            for html_tag in section.tags():
+                try:
+                    del html_tag[:]
+                except IndexError:
+                    pass
+            section_text = section.contents
+
+            subsection_equal_string = "=" * (section.level + 1)
+            begin_subsection_index = section_text.find(subsection_equal_string)
+            if begin_subsection_index > -1:
+                section_text = section_text[:begin_subsection_index]
+
+            section_text = re.sub(r"\[\[(File:|Image:)([^\]]+)\]\]", r"", section_text)
+            section_text = re.sub(r"\[\[([^|\]]*\|)?([^\]]+)\]\]", r"\2", section_text)
+            section_text = section_text.replace("'''", "")
+            section_text = section_text.strip()
+            section_text = html.unescape(section_text)
+
+            section_sentences = [sent.strip() for sent in nltk.sent_tokenize(section_text, language=language) if sent.strip() != "" and not any(sent.startswith(prefix) for prefix in BAD_SENTENCE_PREFIXES)]
+
+            if len(section_sentences) > 0:
+                cleaned_text = "\n".join(section_sentences)
+                parsed_sections.append({
+                    "title": section.title,
+                    "length": len(nltk.word_tokenize(cleaned_text, language=language)),
+                    "links": section_links,
+                    "text": cleaned_text,
+                })
+
+    info['sections'] = parsed_sections
+    return info
+
+
+def _articles_per_second(parse, articles, *args):
+    """
+    Parse all given articles and measure the throughput
+
+    :param parse: parse function to measure
+    :type parse: Callable
+    :param articles: article information dicts (with raw text)
+    :type articles: list[dict[str]]
+    :return: parsed articles and articles per second
+    :rtype: tuple[list[dict[str]], float]
+    """
+    start = time.perf_counter()
+    parsed_articles = [parse(dict(info), *args) for info in articles]
+    return parsed_articles, len(articles) / (time.perf_counter() - start)
+
+
+def benchmark_cleaning(wiki_name, wiki_prefix, language='english', limit=1000):
+    """
+    Compare the article parsing with the reference implementation on a sample of a dump
+
+    :param wiki_name: name of the wikia dump to use
+    :type wiki_name: str
+    :param wiki_prefix: prefix for special pages of this wiki (will be ingored)
+    :type wiki_prefix: str
+    :param language: language of this wiki
+    :type language: str
+    :param limit: number of articles to parse
+    :type limit: int
+    """
+    articles = list(islice(iter_articles(get_dump_path(wiki_name), wiki_prefix), limit))
+    ignores = adapt_ignores(wiki_prefix)
+
+    # Warm up tokenizer models
+    nltk.sent_tokenize("Warm up.", language=language)
+
+    reference, reference_speed = _articles_per_second(_parse_article_reference, articles, list(ignores), language)
+    current, current_speed = _articles_per_second(parse_article, articles, compile_ignores(ignores), language)
+
+    differences = sum(1 for a, b in zip(reference, current) if a != b)
+    print(f"Articles: {len(articles)}")
+    print(f"Reference: {reference_speed:.1f} articles/s")
+    print(f"Current: {current_speed:.1f} articles/s ({current_speed / reference_speed:.2f}x)")
+    print(f"Articles with differing output: {differences}")
+
+
+def _clean_sections(raw_text, ignores, engine):
+    """
+    Clean the sections of a raw article text with a given cleanup engine
+
+    :param raw_text: raw text of the article
+    :type raw_text: str
+    :param ignores: links to ignore (prefixes, see compile_ignores)
+    :type ignores: re.Pattern
+    :param engine: cleanup engine to use ("wtp" or "spans")
+    :type engine: str
+    :return: cleaned sections (see _clean_sections_wtp) and whether the spans engine had to fall back
+    :rtype: tuple[list[tuple[str, int, list[str], str]], bool]
+    """
+    parsed_text = wtp.parse(comment_cleaner.sub("", raw_text))
+    if engine == "spans":
+        cleaned_sections = _clean_sections_spans(parsed_text, ignores)
+        if cleaned_sections is not None:
+            return cleaned_sections, False
+        return list(_clean_sections_wtp(parsed_text, ignores)), True
+    return list(_clean_sections_wtp(parsed_text, ignores)), False
+
+
+def benchmark_cleanup_engines(wiki_name, wiki_prefix, limit=1000, heaviest=20):
+    """
+    Compare the spans cleanup engine with the wikitextparser engine on a sample of a dump
+
+    Checks that both engines produce identical sections for all articles and measures their speed on the heaviest
+    articles (by raw text length).
+
+    :param wiki_name: name of the wikia dump to use
+    :type wiki_name: str
+    :param wiki_prefix: prefix for special pages of this wiki (will be ingored)
+    :type wiki_prefix: str
+    :param limit: number of articles to compare
+    :type limit: int
+    :param heaviest: number of heaviest articles to measure the speed on
+    :type heaviest: int
+    """
+    articles = [info["raw_text"] for info in islice(iter_articles(get_dump_path(wiki_name), wiki_prefix), limit)]
+    ignores = compile_ignores(adapt_ignores(wiki_prefix))
+
+    differences = 0
+    fallbacks = 0
+    for raw_text in articles:
+        reference, _ = _clean_sections(raw_text, ignores, "wtp")
+        cleaned_sections, fallback = _clean_sections(raw_text, ignores, "spans")
+        differences += reference != cleaned_sections
+        fallbacks += fallback
+
+    heavy_articles = sorted(articles, key=len, reverse=True)[:heaviest]
+    durations = {}
+    for engine in ["wtp", "spans"]:
+        start = time.perf_counter()
+        for raw_text in heavy_articles:
+            _clean_sections(raw_text, ignores, engine)
+        durations[engine] = time.perf_counter() - start
+
+    print(f"Articles: {len(articles)}")
+    print(f"Articles with differing sections: {differences}")
+    print(f"Articles falling back to the wtp engine: {fallbacks}")
+    print(f"Heaviest {len(heavy_articles)} articles ({sum(len(raw_text) for raw_text in heavy_articles)} characters):")
+    print(f"wtp: {durations['wtp']:.2f}s")
+    print(f"spans: {durations['spans']:.2f}s ({durations['wtp'] / durations['spans']:.2f}x)")
+
+
+def _compute_overlap_reference(target_text_tokens, source_text_unified_tokens):
+    """
+    Reference implementation of the bigram overlap (with sets of token tuples as before the optimizations)
+
+    :param target_text_tokens: tokens of the first text
+    :type target_text_tokens: list[str]
+    :param source_text_unified_tokens: tokens of the second text
+    :type source_text_unified_tokens: list[str]
+    :return: percentage of bigram overlap between the given texts
+    :rtype: float
+    """
+    bigrams_target = nltk.bigrams(target_text_tokens)
+    bigrams_source = set(nltk.bigrams(source_text_unified_tokens))
+    bigrams_found_not_found = [1 if bigram in bigrams_source else 0 for bigram in bigrams_target]
+    return sum(bigrams_found_not_found) / float(len(bigrams_found_not_found)) * 100
+
+
+def benchmark_overlap(sizes=(1000, 10000, 100000, 1000000), targets=20, target_length=300):
+    """
+    Compare the bigram overlap with the reference implementation on synthetic texts of different sizes
+
+    Tokens are drawn from a Zipf-like distribution, targets partly copy passages of the source (like sections
+    summarizing their linked articles).
+
+    :param sizes: numbers of source tokens
+    :type sizes: Iterable[int]
+    :param targets: number of target texts per source
+    :type targets: int
+    :param target_length: number of tokens of each target text
+    :type target_length: int
+    """
+    generator = random.Random(42)
+    for size in sizes:
+        vocabulary = [f"token{i}" for i in range(max(100, size // 10))]
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        source = generator.choices(vocabulary, weights, k=size)
+        target_texts = []
+        for _ in range(targets):
+            start = generator.randrange(size - target_length // 2)
+            target_texts.append(source[start:start + target_length // 2] + generator.choices(vocabulary, weights, k=target_length // 2))
+
+        durations = {}
+        results = {}
+        for name, compute in [("reference", lambda target: _compute_overlap_reference(target, source)),
+                              ("current", lambda target: _compute_overlap(None, source, "english", target))]:
+            start = time.perf_counter()
+            results[name] = [compute(target) for target in target_texts]
+            durations[name] = time.perf_counter() - start
+
+        differences = sum(1 for a, b in zip(results["reference"], results["current"]) if a != b)
+        print(f"Source tokens: {size}")
+        print(f"Reference: {durations['reference'] / targets * 1000:.2f}ms per overlap")
+        print(f"Current: {durations['current'] / targets * 1000:.2f}ms per overlap ({durations['reference'] / durations['current']:.2f}x)")
+        print(f"Overlaps differing: {differences}")
+
+
+def _build_concept_based_problem_reference(source_text_processed, concept_weights, concepts, TARGET_LENGTH):
+    """
+    Reference implementation of the concept-based ILP formulation (testing all concept/sentence pairs as before the
+    optimizations)
+
+    :param source_text_processed: text to pool from (preprocessed)
+    :type source_text_processed: list[dict[str, any]]
+    :param concept_weights: dictionary of weights representing the value of concepts in the target text
+    :type concept_weights: dict[str, int]
+    :param concepts: concepts of the target text (sorted by their weight, descending)
+    :type concepts: list[str]
+    :param TARGET_LENGTH: desired length (maximum) of the recreated summary
+    :type TARGET_LENGTH: int
+    :return: the problem and the sentence variables
+    :rtype: tuple[pulp.LpProblem, dict[int, pulp.LpVariable]]
+    """
+    COUNT_CONCEPTS = len(concepts)
+    COUNT_SENTENCES = len(source_text_processed)
+
+    prob = pulp.LpProblem("Recreate Text with Extracted Sentences Problem", pulp.LpMaximize)
+    c = pulp.LpVariable.dicts(name='c', indexs=range(COUNT_CONCEPTS), lowBound=0, upBound=1, cat='Integer')
+    s = pulp.LpVariable.dicts(name='s', indexs=range(COUNT_SENTENCES), lowBound=0, upBound=1, cat='Integer')
+    prob += pulp.lpSum(concept_weights[concepts[i]] * c[i] for i in range(COUNT_CONCEPTS))
+    prob += pulp.lpSum(s[j] * source_text_processed[j]["length"] for j in range(COUNT_SENTENCES)) <= TARGET_LENGTH
+
+    for i in range(COUNT_CONCEPTS):
+        for j in range(COUNT_SENTENCES):
+            if concepts[i] in source_text_processed[j]["concepts"]:
+                prob += s[j] <= c[i]
+
+    for i in range(COUNT_CONCEPTS):
+        prob += pulp.lpSum(s[j] for j in range(COUNT_SENTENCES)
+                           if concepts[i] in source_text_processed[j]["concepts"]) >= c[i]
+
+    return prob, s
+
+
+def _get_lp_string(prob):
+    """
+    Get the LP file representation of a problem (to compare problems)
+
+    :param prob: problem to write
+    :type prob: pulp.LpProblem
+    :return: content of the LP file
+    :rtype: str
+    """
+    handle, lp_path = tempfile.mkstemp(suffix=".lp")
+    os.close(handle)
+    try:
+        prob.writeLP(lp_path)
+        with open(lp_path, "r") as lp_file:
+            return lp_file.read()
+    finally:
+        os.remove(lp_path)
+
+
+def benchmark_ilp(sentence_counts=(100, 500, 2000), concept_count=300, target_length=250):
+    """
+    Compare the building of the concept-based ILP with the reference implementation and measure build and solve time
+    on synthetic texts
+
+    :param sentence_counts: numbers of source sentences
+    :type sentence_counts: Iterable[int]
+    :param concept_count: number of distinct concepts of the target text
+    :type concept_count: int
+    :param target_length: desired length (maximum) of the recreated summary
+    :type target_length: int
+    """
+    generator = random.Random(42)
+    vocabulary = [f"token{i}" for i in range(2000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    for sentence_count in sentence_counts:
+        source_text_processed = []
+        for j in range(sentence_count):
+            tokens = generator.choices(vocabulary, weights, k=generator.randint(5, 40))
+            source_text_processed.append({
+                "concepts": [f"{b0} {b1}" for b0, b1 in nltk.bigrams(tokens)],
+                "length": len(tokens),
+                "tokens": tokens,
+                "untokenized_form": " ".join(tokens),
+                "position": j,
+            })
+        # Most concepts of the target text are found in the source
+        source_concepts = sorted(set(concept for sentence in source_text_processed for concept in sentence["concepts"]))
+        concept_weights = {concept: generator.randint(1, 3) for concept in generator.sample(source_concepts, min(concept_count * 4 // 5, len(source_concepts)))}
+        for i in range(concept_count - len(concept_weights)):
+            concept_weights[f"missing{i} concept"] = 1
+        concepts = sorted(concept_weights, key=concept_weights.get, reverse=True)
+
+        durations = {}
+        problems = {}
+        for name, build in [("reference", _build_concept_based_problem_reference), ("current", _build_concept_based_problem)]:
+            start = time.perf_counter()
+            problems[name] = build(source_text_processed, concept_weights, concepts, target_length)[0]
+            durations[name] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        problems["current"].solve(pulp.PULP_CBC_CMD(msg=False))
+        solve_duration = time.perf_counter() - start
+
+        identical = _get_lp_string(problems["reference"]) == _get_lp_string(problems["current"])
+        print(f"Sentences: {sentence_count}, concepts: {len(concepts)}, constraints: {len(problems['current'].constraints)}")
+        print(f"Build reference: {durations['reference']:.3f}s")
+        print(f"Build current: {durations['current']:.3f}s ({durations['reference'] / durations['current']:.2f}x)")
+        print(f"Solve: {solve_duration:.3f}s")
+        print(f"Identical problems: {identical}")
+
+
+def benchmark_sentence_based_solvers(sentence_counts=(100, 500, 2000), problems=20, target_length=250):
+    """
+    Compare the solvers of the sentence-based recreation (knapsack dynamic programming and ILP) on synthetic texts
+
+    :param sentence_counts: numbers of source sentences
+    :type sentence_counts: Iterable[int]
+    :param problems: number of problems per sentence count
+    :type problems: int
+    :param target_length: desired length (maximum) of the recreated summary
+    :type target_length: int
+    """
+    generator = random.Random(42)
+    vocabulary = [f"token{i}" for i in range(2000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    solver = overlap.SENTENCE_BASED_SOLVER
+    for sentence_count in sentence_counts:
+        instances = []
+        for _ in range(problems):
+            source_text_processed = []
+            for j in range(sentence_count):
+                tokens = generator.choices(vocabulary, weights, k=generator.randint(5, 40))
+                source_text_processed.append({
+                    "concepts": [f"{b0} {b1}" for b0, b1 in nltk.bigrams(tokens)],
+                    "length": len(tokens),
+                    "tokens": tokens,
+                    "untokenized_form": " ".join(tokens),
+                    "position": j,
+                })
+            target_tokens = generator.choices(vocabulary, weights, k=target_length)
+            concept_weights = {}
+            for b0, b1 in nltk.bigrams(target_tokens):
+                concept_weights[f"{b0} {b1}"] = concept_weights.get(f"{b0} {b1}", 0) + 1
+            instances.append((source_text_processed, concept_weights))
+
+        durations = {}
+        scores = {}
+        for name in ["ilp", "dp"]:
+            overlap.SENTENCE_BASED_SOLVER = name
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                scores[name] = [recreate_text_sentence_based(source_text_processed, concept_weights, target_length)[1]
+                                for source_text_processed, concept_weights in instances]
+            durations[name] = time.perf_counter() - start
+        overlap.SENTENCE_BASED_SOLVER = solver
+
+        differences = sum(1 for a, b in zip(scores["ilp"], scores["dp"]) if abs(a - b) > 1e-6)
+        print(f"Sentences: {sentence_count}")
+        print(f"ILP: {durations['ilp'] / problems * 1000:.2f}ms per problem")
+        print(f"DP: {durations['dp'] / problems * 1000:.2f}ms per problem ({durations['ilp'] / durations['dp']:.2f}x)")
+        print(f"Problems with differing scores: {differences}")
+
+
+def benchmark_warm_start(sentence_counts=(100, 500, 2000), problems=10, target_length=250):
+    """
+    Measure the concept-based recreation with and without warm-starting it with the sentence-based labels for all
+    available solver backends on synthetic texts
+
+    :param sentence_counts: numbers of source sentences
+    :type sentence_counts: Iterable[int]
+    :param problems: number of problems per sentence count
+    :type problems: int
+    :param target_length: desired length (maximum) of the recreated summary
+    :type target_length: int
+    """
+    generator = random.Random(42)
+    vocabulary = [f"token{i}" for i in range(2000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    backends = ["cbc"] + (["highs"] if solver.highspy is not None else [])
+    ilp_solver = solver.ILP_SOLVER
+    for sentence_count in sentence_counts:
+        instances = []
+        for _ in range(problems):
+            source_text_processed = []
+            for j in range(sentence_count):
+                tokens = generator.choices(vocabulary, weights, k=generator.randint(5, 40))
+                source_text_processed.append({
+                    "concepts": [f"{b0} {b1}" for b0, b1 in nltk.bigrams(tokens)],
+                    "length": len(tokens),
+                    "tokens": tokens,
+                    "untokenized_form": " ".join(tokens),
+                    "position": j,
+                })
+            target_tokens = generator.choices(vocabulary, weights, k=target_length)
+            concept_weights = {}
+            for b0, b1 in nltk.bigrams(target_tokens):
+                concept_weights[f"{b0} {b1}"] = concept_weights.get(f"{b0} {b1}", 0) + 1
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                initial_labels = recreate_text_sentence_based(source_text_processed, concept_weights, target_length)[0]
+            instances.append((source_text_processed, concept_weights, initial_labels))
+
+        print(f"Sentences: {sentence_count}")
+        for backend in backends:
+            solver.ILP_SOLVER = backend
+            durations = {}
+            scores = {}
+            for warm_start in [False, True]:
+                start = time.perf_counter()
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    scores[warm_start] = [recreate_text_concept_based(source_text_processed, concept_weights, target_length,
+                                                                      initial_labels if warm_start else None, "exact")[1]
+                                          for source_text_processed, concept_weights, initial_labels in instances]
+                durations[warm_start] = time.perf_counter() - start
+            differences = sum(1 for a, b in zip(scores[False], scores[True]) if abs(a - b) > 1e-6)
+            print(f"{backend} cold: {durations[False] / problems * 1000:.2f}ms per problem")
+            print(f"{backend} warm: {durations[True] / problems * 1000:.2f}ms per problem ({durations[False] / durations[True]:.2f}x), "
+                  f"{differences} problems with differing scores")
+        solver.ILP_SOLVER = ilp_solver
+
+
+if __name__ == "__main__":
+    benchmark = sys.argv[1]
+    if benchmark == "cleaning":
+        wiki_name = sys.argv[2]
+        wiki_prefix = sys.argv[3]
+        limit = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+        benchmark_cleaning(wiki_name, wiki_prefix, limit=limit)
+    elif benchmark == "cleanup":
+        wiki_name = sys.argv[2]
+        wiki_prefix = sys.argv[3]
+        limit = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+        heaviest = int(sys.argv[5]) if len(sys.argv) > 5 else 20
+        benchmark_cleanup_engines(wiki_name, wiki_prefix, limit, heaviest)
+    elif benchmark == "overlap":
+        sizes = [int(size) for size in sys.argv[2:]] if len(sys.argv) > 2 else [1000, 10000, 100000, 1000000]
+        benchmark_overlap(sizes)
+    elif benchmark == "ilp":
+        sentence_counts = [int(count) for count in sys.argv[2:]] if len(sys.argv) > 2 else [100, 500, 2000]
+        benchmark_ilp(sentence_counts)
+    elif benchmark == "warmstart":
+        sentence_counts = [int(count) for count in sys.argv[2:]] if len(sys.argv) > 2 else [100, 500, 2000]
+        benchmark_warm_start(sentence_counts)
+    elif benchmark == "knapsack":
+        sentence_counts = [int(count) for count in sys.argv[2:]] if len(sys.argv) > 2 else [100, 500, 2000]
+        benchmark_sentence_based_solvers(sentence_counts)
+    else:
+        raise ValueError(f"Unknown benchmark {benchmark}")
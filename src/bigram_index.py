@@ -0,0 +1,206 @@
+from hashlib import blake2b
+
+import numpy as np
+
+
+# Multiplier for combining two token hashes to a bigram hash (odd, so no information is lost modulo 2^64)
+_BIGRAM_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _hash_tokens(tokens, token_hashes):
+    """
+    Hash all given tokens (stable over processes, unlike the builtin hash)
+
+    :param tokens: tokens to hash
+    :type tokens: list[str]
+    :param token_hashes: cache of already computed token hashes (will be updated)
+    :type token_hashes: dict[str, int]
+    :return: 64 bit hashes of the tokens
+    :rtype: np.ndarray
+    """
+    hashes = np.empty(len(tokens), dtype=np.uint64)
+    for i, token in enumerate(tokens):
+        token_hash = token_hashes.get(token)
+        if token_hash is None:
+            token_hash = int.from_bytes(blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            token_hashes[token] = token_hash
+        hashes[i] = token_hash
+    return hashes
+
+
+def hash_bigrams(tokens, token_hashes=None):
+    """
+    Hash all bigrams of the given tokens
+
+    :param tokens: tokens of a text
+    :type tokens: list[str]
+    :param token_hashes: cache of already computed token hashes (will be updated)
+    :type token_hashes: dict[str, int]
+    :return: 64 bit hashes of all bigrams (in the order of the text)
+    :rtype: np.ndarray
+    """
+    hashes = _hash_tokens(tokens, token_hashes if token_hashes is not None else {})
+    # Overflows are intended (arithmetic modulo 2^64)
+    return hashes[:-1] * _BIGRAM_MULTIPLIER + hashes[1:]
+
+
+def get_index_entry(tokens):
+    """
+    Get the index entry of an article
+
+    :param tokens: tokens of the article
+    :type tokens: list[str]
+    :return: sorted unique bigram hashes, first and last token ("" if there are no tokens)
+    :rtype: tuple[np.ndarray, str, str]
+    """
+    if len(tokens) == 0:
+        return np.empty(0, dtype=np.uint64), "", ""
+    return np.unique(hash_bigrams(tokens)), tokens[0], tokens[-1]
+
+
+def _pack_strings(strings):
+    """
+    Pack strings into one UTF-8 byte array with offsets (strings of different lengths are stored without padding)
+
+    :param strings: strings to pack
+    :type strings: list[str]
+    :return: concatenated encoded strings and the start of each string (and the end of the last one)
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data, offsets):
+    """
+    Unpack strings packed with _pack_strings
+
+    :param data: concatenated encoded strings
+    :type data: np.ndarray
+    :param offsets: start of each string (and the end of the last one)
+    :type offsets: np.ndarray
+    :return: unpacked strings
+    :rtype: list[str]
+    """
+    data = data.tobytes()
+    offsets = offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+class BigramIndex:
+    """
+    Hashed bigram sets of all articles of a wiki for estimating the overlap of a text with (joined) articles
+
+    Articles are stored with sorted unique bigram hashes and their first and last token (to cover the bigrams
+    spanning two joined articles). Articles without text are not part of the index.
+    """
+
+    def __init__(self, names, offsets, hashes, first_tokens, last_tokens):
+        """
+        :param names: names of the indexed articles
+        :type names: list[str]
+        :param offsets: start of the bigram hashes of each article in hashes (and the end of the last one)
+        :type offsets: np.ndarray
+        :param hashes: concatenated sorted bigram hashes of all articles
+        :type hashes: np.ndarray
+        :param first_tokens: first token of each article ("" if the article has no tokens)
+        :type first_tokens: list[str]
+        :param last_tokens: last token of each article ("" if the article has no tokens)
+        :type last_tokens: list[str]
+        """
+        self.names = names
+        self.offsets = offsets
+        self.hashes = hashes
+        self.first_tokens = first_tokens
+        self.last_tokens = last_tokens
+        self._positions = {name: i for i, name in enumerate(names)}
+
+    @classmethod
+    def build(cls, entries):
+        """
+        Build the index from the entries of all articles
+
+        :param entries: article names with their index entries (see get_index_entry), articles without text are
+                        left out
+        :type entries: Iterable[tuple[str, tuple[np.ndarray, str, str]]]
+        :return: index of the given articles
+        :rtype: BigramIndex
+        """
+        names, offsets, hashes, first_tokens, last_tokens = [], [0], [], [], []
+        for name, (bigrams, first_token, last_token) in entries:
+            names.append(name)
+            hashes.append(bigrams)
+            offsets.append(offsets[-1] + len(bigrams))
+            first_tokens.append(first_token)
+            last_tokens.append(last_token)
+        return cls(names, np.array(offsets, dtype=np.int64),
+                   np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64), first_tokens, last_tokens)
+
+    @classmethod
+    def load(cls, index_path):
+        """
+        Load an index stored with save
+
+        :param index_path: path of the npz file
+        :type index_path: str
+        :return: stored index (None if it was stored in an older format)
+        :rtype: BigramIndex
+        """
+        with np.load(index_path) as index_file:
+            if "names_data" not in index_file.files:
+                return None
+            strings = {key: _unpack_strings(index_file[key + "_data"], index_file[key + "_offsets"])
+                       for key in ["names", "first_tokens", "last_tokens"]}
+            return cls(strings["names"], index_file["offsets"], index_file["hashes"],
+                       strings["first_tokens"], strings["last_tokens"])
+
+    def save(self, index_path):
+        """
+        Store the index as npz file
+
+        :param index_path: path of the npz file
+        :type index_path: str
+        """
+        strings = {}
+        for key, values in [("names", self.names), ("first_tokens", self.first_tokens), ("last_tokens", self.last_tokens)]:
+            strings[key + "_data"], strings[key + "_offsets"] = _pack_strings(values)
+        np.savez(index_path, offsets=self.offsets, hashes=self.hashes, **strings)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def estimate_overlap(self, target_tokens, names):
+        """
+        Estimate the bigram overlap (see assign._compute_overlap) of a text with the joined given articles
+
+        The estimate is exact if the joined articles are tokenized like the single ones and no hashes collide.
+        Collisions can only increase the estimate.
+
+        :param target_tokens: tokens of the text
+        :type target_tokens: list[str]
+        :param names: names of the articles (in the order in which they are joined)
+        :type names: list[str]
+        :return: estimated percentage of bigrams of the text found in the articles
+        :rtype: float
+        """
+        token_hashes = {}
+        target_bigrams = hash_bigrams(target_tokens, token_hashes)
+        # Articles without tokens are left out when joining
+        positions = [self._positions[name] for name in names
+                     if name in self._positions and self.first_tokens[self._positions[name]] != ""]
+
+        # Bigrams spanning two joined articles
+        boundary_tokens = []
+        for previous, following in zip(positions, positions[1:]):
+            boundary_tokens.extend([self.last_tokens[previous], self.first_tokens[following]])
+        boundary_hashes = _hash_tokens(boundary_tokens, token_hashes)
+        boundary_bigrams = boundary_hashes[0::2] * _BIGRAM_MULTIPLIER + boundary_hashes[1::2]
+
+        source_bigrams = np.concatenate([self.hashes[self.offsets[position]:self.offsets[position + 1]]
+                                         for position in positions] + [boundary_bigrams])
+        return np.isin(target_bigrams, source_bigrams).sum() / float(len(target_bigrams)) * 100
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Cache with a size budget that evicts the least recently used entries first
+    """
+
+    def __init__(self, max_size):
+        """
+        :param max_size: budget for the summed up sizes of all entries (0 disables the cache)
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Get a cached value (and mark it as recently used)
+
+        :param key: key of the entry
+        :type key: Hashable
+        :param default: value to return if there is no such entry
+        :type default: any
+        :return: cached value or the default
+        :rtype: any
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        """
+        Add (or replace) an entry and evict the least recently used entries until the budget is met again
+
+        Entries larger than the whole budget are not cached.
+
+        :param key: key of the entry
+        :type key: Hashable
+        :param value: value to cache
+        :type value: any
+        :param size: size of the value (in the same unit as the budget)
+        :type size: int
+        """
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[1]
+        if size > self.max_size:
+            return
+
+        self._entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def get_statistics(self):
+        """
+        Get hit, miss and eviction counts of the cache
+
+        :return: statistics of the cache
+        :rtype: dict[str, int]
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size": self.size,
+        }
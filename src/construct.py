@@ -1,12 +1,17 @@
 import random
 import sys
+from os import path
 
 from assign import assign
 from eval_quality import aggregate_label_scores
-from parse_dump import extract_articles, parse_texts
+from parse_dump import extract_articles, parse_texts, extract_and_parse_articles, FUSE_EXTRACT_AND_PARSE, DATA_PATH
 from prepare_manual_evaluation import prepare_manual_evaluation
+from profiling import start_report, stage, write_report
 from split import split
 
+# Write timings and counters of all stages to a json report in the experiment folder
+WRITE_REPORT = True
+
 
 def construct_corpus(wiki_name, wiki_prefix, language, experiment, threshold):
     """
@@ -23,20 +28,36 @@ def construct_corpus(wiki_name, wiki_prefix, language, experiment, threshold):
     :param threshold: if higher than 0, only files with sentence-based threshold over given threshold are considered
     :type threshold: int
     """
+    if WRITE_REPORT:
+        start_report(path.join(DATA_PATH, wiki_name, experiment, "construct_report.json"),
+                     wiki_name=wiki_name, experiment=experiment, language=language, threshold=threshold)
+
     # Parse dump
-    extract_articles(wiki_name, wiki_prefix)
-    parse_texts(wiki_name, wiki_prefix, language)
+    if FUSE_EXTRACT_AND_PARSE:
+        with stage("extract_and_parse"):
+            extract_and_parse_articles(wiki_name, wiki_prefix, language)
+    else:
+        with stage("extract"):
+            extract_articles(wiki_name, wiki_prefix)
+        with stage("parse"):
+            parse_texts(wiki_name, wiki_prefix, language)
 
     # Assign candidates
-    assign(wiki_name, experiment, language)
+    with stage("assign"):
+        assign(wiki_name, experiment, language)
 
     # Prepare evaluation
-    aggregate_label_scores(wiki_name, experiment)
-    prepare_manual_evaluation(wiki_name, experiment)
+    with stage("aggregate_label_scores"):
+        aggregate_label_scores(wiki_name, experiment)
+    with stage("prepare_manual_evaluation"):
+        prepare_manual_evaluation(wiki_name, experiment)
 
     # Apply threshold and split
-    random.seed(42)
-    split(wiki_name, experiment, threshold)
+    with stage("split"):
+        random.seed(42)
+        split(wiki_name, experiment, threshold)
+
+    write_report()
 
 
 if __name__ == "__main__":
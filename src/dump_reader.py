@@ -0,0 +1,217 @@
+import bz2
+import gzip
+import io
+import lzma
+import re
+import sys
+from collections import deque
+from multiprocessing import Pool, cpu_count
+from os import path
+
+
+# Supported dump file endings (in order of preference)
+DUMP_EXTENSIONS = [".xml", ".xml.bz2", ".xml.gz", ".xml.xz"]
+
+# Size of the raw blocks multistream bz2 dumps are split into for parallel decompression
+BZ2_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Every stream of a multistream bz2 file starts with the stream magic followed by the block magic (pi)
+bz2_stream_header = re.compile(rb"BZh[1-9]1AY&SY")
+
+
+def find_dump(dump_dir, wiki_name):
+    """
+    Find the (possibly compressed) dump for a given wiki
+
+    :param dump_dir: folder containing the dumps
+    :type dump_dir: str
+    :param wiki_name: name of the wikia dump
+    :type wiki_name: str
+    :return: path of the dump
+    :rtype: str
+    """
+    for extension in DUMP_EXTENSIONS:
+        dump_path = path.join(dump_dir, wiki_name + extension)
+        if path.exists(dump_path):
+            return dump_path
+    raise FileNotFoundError(f"No dump for {wiki_name} found in {dump_dir} (tried {', '.join(DUMP_EXTENSIONS)})")
+
+
+def open_dump(dump_path, workers=None):
+    """
+    Open a (possibly compressed) dump for reading
+
+    Compression is detected from the file ending. Multistream bz2 dumps are decompressed in parallel blocks,
+    use "-" to read an uncompressed stream from stdin (e.g., piped from 7z x -so).
+
+    :param dump_path: path of the dump
+    :type dump_path: str
+    :param workers: number of processes used for bz2 decompression (defaults to the number of cores)
+    :type workers: int
+    :return: binary file object with the uncompressed xml
+    :rtype: io.BufferedIOBase
+    """
+    if dump_path == "-":
+        return sys.stdin.buffer
+    if dump_path.endswith(".bz2"):
+        return _open_bz2(dump_path, workers)
+    if dump_path.endswith(".gz"):
+        return gzip.open(dump_path, "rb")
+    if dump_path.endswith(".xz"):
+        return lzma.open(dump_path, "rb")
+    return open(dump_path, "rb")
+
+
+def _open_bz2(dump_path, workers):
+    """
+    Open a bz2 compressed dump, using parallel decompression for multistream files
+
+    :param dump_path: path of the dump
+    :type dump_path: str
+    :param workers: number of processes used for decompression
+    :type workers: int
+    :return: binary file object with the uncompressed xml
+    :rtype: io.BufferedIOBase
+    """
+    if workers is None:
+        workers = cpu_count()
+
+    with open(dump_path, "rb") as dump_file:
+        head = dump_file.read(BZ2_CHUNK_SIZE)
+
+    # Fall back to sequential decompression for single stream files (they cannot be split)
+    if workers <= 1 or _find_last_stream_start(head) <= 0:
+        return bz2.open(dump_path, "rb")
+
+    return io.BufferedReader(_ChunkReader(_decompress_parallel(dump_path, workers)), buffer_size=BZ2_CHUNK_SIZE)
+
+
+def _find_last_stream_start(data):
+    """
+    Find the offset of the last bz2 stream header in the given data
+
+    :param data: raw bz2 data
+    :type data: bytes
+    :return: offset of the last stream header (-1 if there is none)
+    :rtype: int
+    """
+    last_start = -1
+    for match in bz2_stream_header.finditer(data):
+        last_start = match.start()
+    return last_start
+
+
+def _iter_bz2_chunks(dump_path):
+    """
+    Split a multistream bz2 file into chunks of complete streams
+
+    :param dump_path: path of the dump
+    :type dump_path: str
+    :return: generator of raw chunks
+    :rtype: Iterator[bytes]
+    """
+    buffer = b""
+    with open(dump_path, "rb") as dump_file:
+        while True:
+            data = dump_file.read(BZ2_CHUNK_SIZE)
+            if not data:
+                break
+            buffer += data
+            cut = _find_last_stream_start(buffer)
+            if cut > 0:
+                yield buffer[:cut]
+                buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
+
+def _decompress_chunk(chunk):
+    """
+    Decompress a chunk of bz2 streams
+
+    :param chunk: raw chunk
+    :type chunk: bytes
+    :return: decompressed data or None if the chunk was not split at a real stream boundary
+    :rtype: bytes
+    """
+    try:
+        return bz2.decompress(chunk)
+    except (OSError, EOFError, ValueError):
+        return None
+
+
+def _decompress_parallel(dump_path, workers):
+    """
+    Decompress a multistream bz2 file with a pool of processes (keeping the order of the chunks)
+
+    :param dump_path: path of the dump
+    :type dump_path: str
+    :param workers: number of processes used for decompression
+    :type workers: int
+    :return: generator of decompressed blocks
+    :rtype: Iterator[bytes]
+    """
+    with Pool(workers) as pool:
+        pending = deque()
+        # Bytes matching the stream header by chance produce chunks that cannot be decompressed on their own,
+        # those are merged with their successors until they can
+        unresolved = b""
+        chunks = _iter_bz2_chunks(dump_path)
+        exhausted = False
+        while pending or not exhausted:
+            # Keep a bounded number of chunks in flight
+            while not exhausted and len(pending) < 2 * workers:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((chunk, pool.apply_async(_decompress_chunk, (chunk,))))
+            if not pending:
+                break
+
+            chunk, result = pending.popleft()
+            decompressed = result.get()
+            if decompressed is not None and not unresolved:
+                yield decompressed
+                continue
+
+            unresolved += chunk
+            decompressed = _decompress_chunk(unresolved)
+            if decompressed is not None:
+                unresolved = b""
+                yield decompressed
+
+        if unresolved:
+            raise OSError(f"Invalid bz2 data in {dump_path}")
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Raw, read-only file object on top of a generator of byte blocks
+    """
+
+    def __init__(self, blocks):
+        self._blocks = blocks
+        self._current = b""
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._position >= len(self._current):
+            self._current = next(self._blocks, None)
+            self._position = 0
+            if self._current is None:
+                self._current = b""
+                return 0
+
+        size = min(len(buffer), len(self._current) - self._position)
+        buffer[:size] = self._current[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        self._blocks.close()
+        super().close()
@@ -1,6 +1,26 @@
 import nltk
+import numpy as np
 from pulp import *
 
+from profiling import timer
+from solver import solve
+
+
+# Leave out sentences that cannot improve the objective (no concept of the target, longer than the summary) before
+# building the ILP problems
+PRUNE_SENTENCES = True
+# Also leave out sentences whose concepts are all contained in another sentence that is not longer (only for the
+# concept-based problem, keeps the optimal score but may select a different solution)
+PRUNE_DOMINATED_SENTENCES = False
+
+# Mode of the concept-based recreation: "exact" (ILP), "greedy" (budgeted maximum coverage greedy) or "lp_rounding"
+# (greedy and rounded LP relaxation, the better of both is used), the approximations are much faster but not optimal
+CONCEPT_BASED_MODE = "exact"
+
+# Solver for the sentence-based recreation (a 0/1 knapsack problem): "dp" (dynamic programming over the lengths,
+# in-process) or "ilp" (with the ILP solver configured in solver.py)
+SENTENCE_BASED_SOLVER = "dp"
+
 
 def convert_raw_text(text, stopword_set):
     """
@@ -23,20 +43,36 @@ def convert_raw_text(text, stopword_set):
         for i, (s, s_tokens) in enumerate(text_sentences)]
 
 
-def convert_preprocessed_text(sentences, stopword_set):
+def convert_preprocessed_text(sentences, stopword_set, concept_ids=None):
     """
     Convert a given list of already preprocessed sentences into the format needed here
 
     Each input sentence representation is expected to have at least the following attributes
     text, tokens, sentence_id, word_count
 
+    With interned concepts, the concepts of each sentence are the ids of its bigrams in the given vocabulary (usually
+    the one of the target text, see generate_concept_weights). Bigrams not in the vocabulary are left out, since they
+    cannot contribute to any score.
+
     :param sentences: list of sentence-info-object
     :type sentences: list[dict[str, any]]
     :param stopword_set: set of stopwords in a corresponding language
     :type stopword_set: set[str]
+    :param concept_ids: ids of the interned concepts by bigram (None for concepts as strings)
+    :type concept_ids: dict[tuple[str, str], int]
     :return: list of sentence representations
     :rtype: list[dict[str, any]]
     """
+    if concept_ids is not None:
+        return [
+            {"concepts": [concept_ids[bigram] for bigram in zip(sent["tokens"], sent["tokens"][1:])
+                          if bigram in concept_ids and not (bigram[0] in stopword_set and bigram[1] in stopword_set)],
+             "length": sent["word_count"],
+             "tokens": sent["tokens"],
+             "untokenized_form": sent["text"],
+             "position": sent["sentence_id"]}
+            for sent in sentences]
+
     return [
         {"concepts": [f"{b0} {b1}" for b0, b1 in nltk.bigrams(sent["tokens"]) if not (b0 in stopword_set and b1 in stopword_set)],
          "length": sent["word_count"],
@@ -46,7 +82,7 @@ def convert_preprocessed_text(sentences, stopword_set):
         for sent in sentences]
 
 
-def generate_concept_weights(text, stopword_set):
+def generate_concept_weights(text, stopword_set, concept_ids=None):
     """
     Generate a dictionary of concept weights for a given raw text
 
@@ -54,19 +90,28 @@ def generate_concept_weights(text, stopword_set):
     :type text: str
     :param stopword_set: set of stopwords in a corresponding language
     :type stopword_set: set[str]
+    :param concept_ids: vocabulary for interning the concepts as integer ids (new bigrams are added to it), None for
+                        concepts as strings
+    :type concept_ids: dict[tuple[str, str], int]
     :return: dictionary of concept weights
-    :rtype: dict[str, int]
+    :rtype: dict[str | int, int]
     """
     concept_weights = dict()
     for sentence in nltk.sent_tokenize(text):
-        for b in [f"{b0} {b1}" for b0, b1 in nltk.bigrams(sentence.lower().split(" ")) if not (b0 in stopword_set and b1 in stopword_set)]:
-            concept_weights[b] = concept_weights.get(b, 0) + 1
+        for b0, b1 in nltk.bigrams(sentence.lower().split(" ")):
+            if b0 in stopword_set and b1 in stopword_set:
+                continue
+            concept = concept_ids.setdefault((b0, b1), len(concept_ids)) if concept_ids is not None else f"{b0} {b1}"
+            concept_weights[concept] = concept_weights.get(concept, 0) + 1
     return concept_weights
 
 
-def recreate_text_concept_based(source_text_processed, concept_weights, TARGET_LENGTH):
+def _get_relevant_sentences(source_text_processed, concept_weights, TARGET_LENGTH, prune_dominated=False):
     """
-    Try to represent a given target text (represented by its concept weights) with sentences from a given source text
+    Get the sentences that can contribute to a recreated summary
+
+    Sentences without any concept of the target text or longer than the summary never improve the objective and are
+    left out (with label 0).
 
     :param source_text_processed: text to pool from (preprocessed)
     :type source_text_processed: list[dict[str, any]]
@@ -74,16 +119,102 @@ def recreate_text_concept_based(source_text_processed, concept_weights, TARGET_L
     :type concept_weights: dict[str, int]
     :param TARGET_LENGTH: desired length (maximum) of the recreated summary
     :type TARGET_LENGTH: int
-    :return: list of binary values (0, 1) representing whether a sentence is part of the extractive summary or not
+    :param prune_dominated: also leave out sentences whose target concepts are all contained in another sentence that
+                            is not longer (only valid for the concept-based problem)
+    :type prune_dominated: bool
+    :return: ascending indices of the relevant sentences
     :rtype: list[int]
     """
-    # Sort concepts by their weight (descending)
-    concepts = sorted(concept_weights, key=concept_weights.get, reverse=True)
+    if not PRUNE_SENTENCES:
+        return list(range(len(source_text_processed)))
+
+    relevant = [j for j, sentence in enumerate(source_text_processed)
+                if sentence["length"] <= TARGET_LENGTH and any(concept in concept_weights for concept in sentence["concepts"])]
+    if not prune_dominated:
+        return relevant
+
+    sentence_concepts = {j: set(concept for concept in source_text_processed[j]["concepts"] if concept in concept_weights)
+                         for j in relevant}
+    concept_sentences = {}
+    for j in relevant:
+        for concept in sentence_concepts[j]:
+            concept_sentences.setdefault(concept, []).append(j)
+
+    def dominates(k, j):
+        # Of two equal sentences, the first one is kept
+        length_k, length_j = source_text_processed[k]["length"], source_text_processed[j]["length"]
+        if length_k > length_j or not sentence_concepts[j] <= sentence_concepts[k]:
+            return False
+        return length_k < length_j or sentence_concepts[j] < sentence_concepts[k] or k < j
+
+    kept = []
+    for j in relevant:
+        # A dominating sentence has to contain the rarest concept of this sentence
+        rarest_concept = min(sentence_concepts[j], key=lambda concept: len(concept_sentences[concept]))
+        if not any(k != j and dominates(k, j) for k in concept_sentences[rarest_concept]):
+            kept.append(j)
+    return kept
+
+
+def _get_solution(source_text_processed, relevant, selected):
+    """
+    Map the values of the sentence variables of a solved problem back to all sentences
+
+    :param source_text_processed: text to pool from (preprocessed)
+    :type source_text_processed: list[dict[str, any]]
+    :param relevant: ascending indices of the sentences of the problem
+    :type relevant: list[int]
+    :param selected: values (0, 1) of the sentence variables of the problem (by position in relevant)
+    :type selected: list[float]
+    :return: labels of all sentences and selected sentences
+    :rtype: tuple[list[int], list[dict[str, any]]]
+    """
+    labels = [0] * len(source_text_processed)
+    for k, j in enumerate(relevant):
+        # Variables without value (no solution found) are not selected
+        labels[j] = int(round(selected[k])) if selected[k] is not None else 0
+    solution = [source_text_processed[j] for j in range(len(source_text_processed)) if labels[j] == 1]
+    return labels, solution
+
+
+def _get_concept_sentences(source_text_processed, concepts):
+    """
+    Build an inverted index from the given concepts to the sentences containing them
+
+    :param source_text_processed: text to pool from (preprocessed)
+    :type source_text_processed: list[dict[str, any]]
+    :param concepts: concepts to index
+    :type concepts: list[str]
+    :return: ascending indices of the sentences containing each concept (in the order of the given concepts)
+    :rtype: list[list[int]]
+    """
+    concept_sentences = {concept: [] for concept in concepts}
+    for j, sentence in enumerate(source_text_processed):
+        # A sentence may contain a concept multiple times
+        for concept in set(sentence["concepts"]):
+            if concept in concept_sentences:
+                concept_sentences[concept].append(j)
+    return [concept_sentences[concept] for concept in concepts]
+
+
+def _build_concept_based_problem(source_text_processed, concept_weights, concepts, TARGET_LENGTH):
+    """
+    Formulate the ILP problem of the concept-based recreation
+
+    :param source_text_processed: text to pool from (preprocessed)
+    :type source_text_processed: list[dict[str, any]]
+    :param concept_weights: dictionary of weights representing the value of concepts in the target text
+    :type concept_weights: dict[str, int]
+    :param concepts: concepts of the target text (sorted by their weight, descending)
+    :type concepts: list[str]
+    :param TARGET_LENGTH: desired length (maximum) of the recreated summary
+    :type TARGET_LENGTH: int
+    :return: the problem, the sentence variables and the concept variables
+    :rtype: tuple[pulp.LpProblem, dict[int, pulp.LpVariable], dict[int, pulp.LpVariable]]
+    """
     COUNT_CONCEPTS = len(concepts)  # count of distinct concepts
     COUNT_SENTENCES = len(source_text_processed)  # count of sentences
 
-    # formulation of the ILP problem
-
     prob = LpProblem("Recreate Text with Extracted Sentences Problem", LpMaximize)
 
     # initialize the concepts binary variables
@@ -106,27 +237,170 @@ def recreate_text_concept_based(source_text_processed, concept_weights, TARGET_L
     # CONSTRAINT FOR SUMMARY SIZE
     prob += pulp.lpSum(s[j] * source_text_processed[j]["length"] for j in range(COUNT_SENTENCES)) <= TARGET_LENGTH
 
-    # INTEGRITY CONSTRAINTS
+    # INTEGRITY CONSTRAINTS (only for the sentences containing a concept)
+    concept_sentences = _get_concept_sentences(source_text_processed, concepts)
     for i in range(COUNT_CONCEPTS):
-        for j in range(COUNT_SENTENCES):
-            if concepts[i] in source_text_processed[j]["concepts"]:
-                prob += s[j] <= c[i]
+        for j in concept_sentences[i]:
+            prob += s[j] <= c[i]
 
     for i in range(COUNT_CONCEPTS):
-        prob += pulp.lpSum(s[j] for j in range(COUNT_SENTENCES)
-                           if concepts[i] in source_text_processed[j]["concepts"]) >= c[i]
+        prob += pulp.lpSum(s[j] for j in concept_sentences[i]) >= c[i]
+
+    return prob, s, c
+
+
+def _greedy_coverage(sentence_concepts, lengths, concept_weights, TARGET_LENGTH, start=()):
+    """
+    Select sentences by the greedy algorithm for budgeted maximum coverage: repeatedly add the sentence with the
+    highest weight of not yet covered concepts per length (that still fits), and use the single best sentence instead
+    if it is better
+
+    :param sentence_concepts: concepts of the target text in each sentence
+    :type sentence_concepts: list[set[str]]
+    :param lengths: length of each sentence
+    :type lengths: list[int]
+    :param concept_weights: dictionary of weights representing the value of concepts in the target text
+    :type concept_weights: dict[str, int]
+    :param TARGET_LENGTH: desired length (maximum) of the recreated summary
+    :type TARGET_LENGTH: int
+    :param start: sentences to start with (have to fit together)
+    :type start: Iterable[int]
+    :return: selected sentences and their score (summed weight of the covered concepts)
+    :rtype: tuple[list[int], int]
+    """
+    selected = list(start)
+    covered = set(concept for k in selected for concept in sentence_concepts[k])
+    used_length = sum(lengths[k] for k in selected)
+    remaining = set(range(len(lengths))).difference(selected)
+
+    while True:
+        best_sentence, best_ratio = None, 0
+        for k in remaining:
+            if used_length + lengths[k] > TARGET_LENGTH:
+                continue
+            gain = sum(concept_weights[concept] for concept in sentence_concepts[k] if concept not in covered)
+            ratio = gain / max(lengths[k], 1)
+            if ratio > best_ratio:
+                best_sentence, best_ratio = k, ratio
+        if best_sentence is None:
+            break
+        selected.append(best_sentence)
+        remaining.discard(best_sentence)
+        covered.update(sentence_concepts[best_sentence])
+        used_length += lengths[best_sentence]
+    score = sum(concept_weights[concept] for concept in covered)
+
+    # The ratio rule alone can be arbitrarily bad (e.g., with one long, valuable sentence)
+    single_scores = [(sum(concept_weights[concept] for concept in sentence_concepts[k]), k)
+                     for k in range(len(lengths)) if lengths[k] <= TARGET_LENGTH]
+    if single_scores:
+        single_score, single_sentence = max(single_scores, key=lambda entry: (entry[0], -entry[1]))
+        if single_score > score:
+            return [single_sentence], single_score
+    return sorted(selected), score
+
+
+def _approximate_concept_based(sentences, concept_weights, concepts, TARGET_LENGTH, lp_rounding):
+    """
+    Approximate the concept-based recreation with the greedy algorithm and (optionally) a rounded LP relaxation
+
+    :param sentences: sentences to pool from (preprocessed)
+    :type sentences: list[dict[str, any]]
+    :param concept_weights: dictionary of weights representing the value of concepts in the target text
+    :type concept_weights: dict[str, int]
+    :param concepts: concepts of the target text (sorted by their weight, descending)
+    :type concepts: list[str]
+    :param TARGET_LENGTH: desired length (maximum) of the recreated summary
+    :type TARGET_LENGTH: int
+    :param lp_rounding: also round the LP relaxation (adding sentences by descending LP value and completing the
+                        selection greedily) and use the better selection
+    :type lp_rounding: bool
+    :return: selection (0, 1) of each sentence, its score and the status of the approximation
+    :rtype: tuple[list[int], int, str]
+    """
+    sentence_concepts = [set(concept for concept in sentence["concepts"] if concept in concept_weights) for sentence in sentences]
+    lengths = [sentence["length"] for sentence in sentences]
+    selected, score = _greedy_coverage(sentence_concepts, lengths, concept_weights, TARGET_LENGTH)
+    status = "Greedy"
+
+    if lp_rounding and sentences:
+        with timer("model_building"):
+            prob, s, _ = _build_concept_based_problem(sentences, concept_weights, concepts, TARGET_LENGTH)
+            for variable in prob.variables():
+                variable.cat = LpContinuous
+        lp_status = solve(prob, "concept_based_lp")
+        if lp_status == "Optimal":
+            start, used_length = [], 0
+            for k in sorted(range(len(sentences)), key=lambda k: s[k].varValue, reverse=True):
+                if s[k].varValue > 0 and used_length + lengths[k] <= TARGET_LENGTH:
+                    start.append(k)
+                    used_length += lengths[k]
+            rounded, rounded_score = _greedy_coverage(sentence_concepts, lengths, concept_weights, TARGET_LENGTH, start)
+            if rounded_score > score:
+                selected, score, status = rounded, rounded_score, "LP rounding"
+
+    selection = [0] * len(sentences)
+    for k in selected:
+        selection[k] = 1
+    return selection, score, status
+
+
+def recreate_text_concept_based(source_text_processed, concept_weights, TARGET_LENGTH, initial_labels=None, mode=None):
+    """
+    Try to represent a given target text (represented by its concept weights) with sentences from a given source text
+
+    The solver can be warm-started with any feasible selection of sentences, e.g., the sentence-based solution.
+
+    :param source_text_processed: text to pool from (preprocessed)
+    :type source_text_processed: list[dict[str, any]]
+    :param concept_weights: dictionary of weights representing the value of concepts (strings or interned ids, like
+                            in source_text_processed) in the target text
+    :type concept_weights: dict[str | int, int]
+    :param TARGET_LENGTH: desired length (maximum) of the recreated summary
+    :type TARGET_LENGTH: int
+    :param initial_labels: labels (0, 1) of a feasible selection of sentences to start from (None for no warm start)
+    :type initial_labels: list[int]
+    :param mode: "exact", "greedy" or "lp_rounding" (defaults to CONCEPT_BASED_MODE)
+    :type mode: str
+    :return: list of binary values (0, 1) representing whether a sentence is part of the extractive summary or not
+    :rtype: list[int]
+    """
+    mode = mode if mode is not None else CONCEPT_BASED_MODE
+    # Sort concepts by their weight (descending)
+    concepts = sorted(concept_weights, key=concept_weights.get, reverse=True)
 
-    # solving the ilp problem
-    prob.solve()
+    with timer("model_building"):
+        relevant = _get_relevant_sentences(source_text_processed, concept_weights, TARGET_LENGTH, PRUNE_DOMINATED_SENTENCES)
+    sentences = [source_text_processed[j] for j in relevant]
+
+    if mode in ["greedy", "lp_rounding"]:
+        with timer("approximation"):
+            selected, score, status = _approximate_concept_based(sentences, concept_weights, concepts, TARGET_LENGTH, mode == "lp_rounding")
+    elif mode == "exact":
+        # formulation of the ILP problem (only with sentences that can contribute)
+        with timer("model_building"):
+            prob, s, c = _build_concept_based_problem(sentences, concept_weights, concepts, TARGET_LENGTH)
+
+        # solving the ilp problem
+        initial_values = None
+        if initial_labels is not None:
+            # Pruned sentences are left out of the start solution (which keeps it feasible)
+            initial_values = {s[k].name: initial_labels[j] for k, j in enumerate(relevant)}
+            selected_concepts = set(concept for j in relevant if initial_labels[j] == 1 for concept in source_text_processed[j]["concepts"])
+            initial_values.update((c[i].name, int(concept in selected_concepts)) for i, concept in enumerate(concepts))
+        status = solve(prob, "concept_based", initial_values)
+
+        selected = [s[k].varValue for k in range(len(relevant))]
+        score = pulp.value(prob.objective)
+    else:
+        raise ValueError(f"Unknown concept-based mode {mode}")
 
     # retrieve the optimal subset of sentences
-    labels = [int(s[i].varValue) for i in range(COUNT_SENTENCES)]
-    score = pulp.value(prob.objective)
-    solution = [source_text_processed[j] for j in range(COUNT_SENTENCES) if s[j].varValue == 1]
+    labels, solution = _get_solution(source_text_processed, relevant, selected)
     solution_text = "\n".join(s["untokenized_form"] for s in solution)
     solution_length = sum(s["length"] for s in solution)
 
-    print("Status:", LpStatus[prob.status])
+    print("Status:", status)
     print("Score:", score)
     print("Labels:", labels)
     print("Solution length:", solution_length)
@@ -135,6 +409,41 @@ def recreate_text_concept_based(source_text_processed, concept_weights, TARGET_L
     return labels, score, solution_length, solution_text
 
 
+def _solve_knapsack(values, lengths, capacity):
+    """
+    Solve a 0/1 knapsack problem exactly by dynamic programming over the (integer) lengths
+
+    :param values: value of each item
+    :type values: list[float]
+    :param lengths: length (non-negative integer) of each item
+    :type lengths: list[int]
+    :param capacity: maximum summed length of the selected items
+    :type capacity: int
+    :return: selection (0, 1) of each item and the optimal summed value
+    :rtype: tuple[list[int], float]
+    """
+    capacity = int(capacity)
+    # best[l]: highest value reachable with the items so far and a summed length of at most l
+    best = np.zeros(capacity + 1, dtype=np.float64)
+    taken = np.zeros((len(values), capacity + 1), dtype=bool)
+    for i, (value, length) in enumerate(zip(values, lengths)):
+        if length > capacity or value <= 0:
+            continue
+        with_item = best[:capacity + 1 - length] + value
+        improved = with_item > best[length:]
+        taken[i, length:] = improved
+        best[length:] = np.where(improved, with_item, best[length:])
+
+    # Trace the selected items back from the full capacity
+    selected = [0] * len(values)
+    remaining = capacity
+    for i in reversed(range(len(values))):
+        if taken[i, remaining]:
+            selected[i] = 1
+            remaining -= lengths[i]
+    return selected, float(best[capacity])
+
+
 def recreate_text_sentence_based(source_text_processed, concept_weights, TARGET_LENGTH):
     """
     Try to represent a given target text with sentences from a given source text
@@ -142,43 +451,57 @@ def recreate_text_sentence_based(source_text_processed, concept_weights, TARGET_
 
     :param source_text_processed: text to pool from (preprocessed)
     :type source_text_processed: list[dict[str, any]]
-    :param concept_weights: dictionary of weights representing the value of concepts in the target text
-    :type concept_weights: dict[str, int]
+    :param concept_weights: dictionary of weights representing the value of concepts (strings or interned ids, like
+                            in source_text_processed) in the target text
+    :type concept_weights: dict[str | int, int]
     :param TARGET_LENGTH: desired length (maximum) of the recreated summary
     :type TARGET_LENGTH: int
     :return: list of binary values (0, 1) representing whether a sentence is part of the extractive summary or not
     :rtype: list[int]
     """
-    COUNT_SENTENCES = len(source_text_processed)  # count of sentences
+    # Only sentences that can contribute are part of the problem
+    relevant = _get_relevant_sentences(source_text_processed, concept_weights, TARGET_LENGTH)
+    sentences = [source_text_processed[j] for j in relevant]
+    COUNT_SENTENCES = len(sentences)  # count of sentences
 
-    # formulation of the ILP problem
+    values = [sum(concept_weights.get(concept, 0) for concept in sentence["concepts"]) for sentence in sentences]
+    lengths = [sentence["length"] for sentence in sentences]
 
-    prob = LpProblem("Recreate Text with Extracted Sentences Non-Distinct Problem", LpMaximize)
+    if SENTENCE_BASED_SOLVER == "dp":
+        with timer("solver"):
+            selected, score = _solve_knapsack(values, lengths, TARGET_LENGTH)
+        status = "Optimal"
+    else:
+        # formulation of the ILP problem
 
-    # initialize the sentences binary variables
-    s = pulp.LpVariable.dicts(name='s',
-                              indexs=range(COUNT_SENTENCES),
-                              lowBound=0,
-                              upBound=1,
-                              cat='Integer')
+        prob = LpProblem("Recreate Text with Extracted Sentences Non-Distinct Problem", LpMaximize)
 
-    # OBJECTIVE FUNCTION
-    prob += pulp.lpSum(s[j] * sum(concept_weights.get(concept, 0) for concept in source_text_processed[j]["concepts"]) for j in range(COUNT_SENTENCES))
+        # initialize the sentences binary variables
+        s = pulp.LpVariable.dicts(name='s',
+                                  indexs=range(COUNT_SENTENCES),
+                                  lowBound=0,
+                                  upBound=1,
+                                  cat='Integer')
 
-    # CONSTRAINT FOR SUMMARY SIZE
-    prob += pulp.lpSum(s[j] * source_text_processed[j]["length"] for j in range(COUNT_SENTENCES)) <= TARGET_LENGTH
+        # OBJECTIVE FUNCTION
+        prob += pulp.lpSum(s[j] * values[j] for j in range(COUNT_SENTENCES))
+
+        # CONSTRAINT FOR SUMMARY SIZE
+        prob += pulp.lpSum(s[j] * lengths[j] for j in range(COUNT_SENTENCES)) <= TARGET_LENGTH
+
+        # solving the ilp problem
+        status = solve(prob, "sentence_based")
 
-    # solving the ilp problem
-    prob.solve()
+        selected = [s[j].varValue for j in range(COUNT_SENTENCES)]
+        # The objective has no terms if no sentence is relevant
+        score = pulp.value(prob.objective) if COUNT_SENTENCES > 0 else 0.0
 
     # retrieve the optimal subset of sentences
-    labels = [int(s[i].varValue) for i in range(COUNT_SENTENCES)]
-    score = pulp.value(prob.objective)
-    solution = [source_text_processed[j] for j in range(COUNT_SENTENCES) if s[j].varValue == 1]
+    labels, solution = _get_solution(source_text_processed, relevant, selected)
     solution_text = "\n".join(s["untokenized_form"] for s in solution)
     solution_length = sum(s["length"] for s in solution)
 
-    print("Status:", LpStatus[prob.status])
+    print("Status:", status)
     print("Score:", score)
     print("Labels:", labels)
     print("Solution length:", solution_length)
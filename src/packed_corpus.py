@@ -0,0 +1,246 @@
+import json
+import sys
+from os import path, makedirs, listdir
+
+import numpy as np
+
+from parse_dump import get_base_path
+
+
+PACKED_FOLDER = "packed"
+
+# Kinds of labels stored with each topic
+LABEL_KINDS = ["concept_based", "sentence_based"]
+
+# Arrays over all tokens / sentences of the corpus (file name without extension, data type)
+_TOKEN_ARRAYS = [("tokens", np.int32), ("pos", np.uint16)]
+_SENTENCE_ARRAYS = [("sentence_ends", np.int64), ("doc_ids", np.int32), ("text_ends", np.int64)] + \
+                   [("labels_" + kind, np.int8) for kind in LABEL_KINDS]
+
+
+def get_packed_path(wiki_name, experiment):
+    """
+    Get the folder of the packed corpus of an experiment
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param experiment: name of the experiment
+    :type experiment: str
+    :return: folder of the packed corpus
+    :rtype: str
+    """
+    return path.join(get_base_path(wiki_name), experiment, PACKED_FOLDER)
+
+
+class PackedCorpusWriter:
+    """
+    Writer for a packed corpus: the inputs and labels of all topics in a few binary files
+
+    All sentences of the corpus are stored consecutively: their tokens and POS tags as ids in a vocabulary, their
+    texts as one UTF-8 blob and end offsets into both (so a sentence is found without reading any other one). Topics
+    (with their other information) are stored as json lines with the range of their sentences.
+    """
+
+    def __init__(self, packed_path):
+        """
+        :param packed_path: folder of the packed corpus (an existing corpus is replaced)
+        :type packed_path: str
+        """
+        makedirs(packed_path, exist_ok=True)
+        self.packed_path = packed_path
+        self.token_ids = {}
+        self.tag_ids = {}
+        self.token_count = 0
+        self.text_length = 0
+        self.sentence_count = 0
+        self._files = {name: open(path.join(packed_path, name + ".bin"), "wb")
+                       for name, _ in _TOKEN_ARRAYS + _SENTENCE_ARRAYS + [("texts", None)]}
+        self._topics_file = open(path.join(packed_path, "topics.jsonl"), "w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_array(self, name, values, dtype):
+        self._files[name].write(np.array(values, dtype=dtype).tobytes())
+
+    def add_topic(self, input_info, labels_infos):
+        """
+        Add a topic
+
+        :param input_info: input information of the topic (like written to inputs/)
+        :type input_info: dict[str]
+        :param labels_infos: labels information of the topic (like written to labels-*/) by kind of labels
+        :type labels_infos: dict[str, dict[str]]
+        """
+        sentences = input_info["inputs"]
+        topic = {key: value for key, value in input_info.items() if key != "inputs"}
+        topic["first_sentence"] = self.sentence_count
+        topic["sentence_count"] = len(sentences)
+        topic["labels"] = {kind: {key: value for key, value in labels_infos[kind].items() if key not in ["id", "labels"]}
+                           for kind in LABEL_KINDS}
+
+        tokens, tags, sentence_ends, text_ends, texts = [], [], [], [], []
+        for sentence in sentences:
+            tokens.extend(self.token_ids.setdefault(token, len(self.token_ids)) for token in sentence["tokens"])
+            tags.extend(self.tag_ids.setdefault(tag, len(self.tag_ids)) for _, tag in sentence["pos"])
+            self.token_count += len(sentence["tokens"])
+            sentence_ends.append(self.token_count)
+            text = sentence["text"].encode("utf-8")
+            texts.append(text)
+            self.text_length += len(text)
+            text_ends.append(self.text_length)
+
+        self._write_array("tokens", tokens, np.int32)
+        self._write_array("pos", tags, np.uint16)
+        self._write_array("sentence_ends", sentence_ends, np.int64)
+        self._write_array("doc_ids", [sentence["doc_id"] for sentence in sentences], np.int32)
+        self._write_array("text_ends", text_ends, np.int64)
+        self._files["texts"].write(b"".join(texts))
+        for kind in LABEL_KINDS:
+            self._write_array("labels_" + kind, labels_infos[kind]["labels"], np.int8)
+        self._topics_file.write(json.dumps(topic) + "\n")
+        self.sentence_count += len(sentences)
+
+    def close(self):
+        """
+        Write the vocabularies and close all files
+        """
+        for file in self._files.values():
+            file.close()
+        self._topics_file.close()
+        with open(path.join(self.packed_path, "vocabulary.json"), "w") as vocabulary_file:
+            json.dump({"tokens": list(self.token_ids), "tags": list(self.tag_ids)}, vocabulary_file)
+
+
+class PackedCorpus:
+    """
+    Reader for a packed corpus (see PackedCorpusWriter), the binary files are memory-mapped so single topics can be
+    read without loading the whole corpus
+    """
+
+    def __init__(self, packed_path):
+        """
+        :param packed_path: folder of the packed corpus
+        :type packed_path: str
+        """
+        with open(path.join(packed_path, "vocabulary.json"), "r") as vocabulary_file:
+            vocabulary = json.load(vocabulary_file)
+        self.tokens = vocabulary["tokens"]
+        self.tags = vocabulary["tags"]
+
+        self.topics = {}
+        with open(path.join(packed_path, "topics.jsonl"), "r") as topics_file:
+            for line in topics_file:
+                topic = json.loads(line)
+                self.topics[topic["id"]] = topic
+
+        self._arrays = {name: self._map(path.join(packed_path, name + ".bin"), dtype)
+                        for name, dtype in _TOKEN_ARRAYS + _SENTENCE_ARRAYS + [("texts", np.uint8)]}
+
+    @staticmethod
+    def _map(filename, dtype):
+        # Empty files cannot be memory-mapped
+        if path.getsize(filename) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode="r")
+
+    def __len__(self):
+        return len(self.topics)
+
+    def __contains__(self, topic_id):
+        return topic_id in self.topics
+
+    def get_ids(self):
+        """
+        Get the ids of all topics
+
+        :return: topic ids (in the order in which they were written)
+        :rtype: list[str]
+        """
+        return list(self.topics)
+
+    def _get_range(self, name, ends, index):
+        start = int(ends[index - 1]) if index > 0 else 0
+        return self._arrays[name][start:int(ends[index])]
+
+    def get_input_info(self, topic_id):
+        """
+        Get the input information of a topic
+
+        :param topic_id: id of the topic
+        :type topic_id: str
+        :return: input information (like stored in inputs/)
+        :rtype: dict[str]
+        """
+        topic = self.topics[topic_id]
+        input_info = {key: value for key, value in topic.items() if key not in ["first_sentence", "sentence_count", "labels"]}
+        sentence_ends = self._arrays["sentence_ends"]
+        text_ends = self._arrays["text_ends"]
+        inputs = []
+        for sentence_id in range(topic["sentence_count"]):
+            index = topic["first_sentence"] + sentence_id
+            tokens = [self.tokens[token_id] for token_id in self._get_range("tokens", sentence_ends, index)]
+            tags = [self.tags[tag_id] for tag_id in self._get_range("pos", sentence_ends, index)]
+            inputs.append({
+                "text": self._get_range("texts", text_ends, index).tobytes().decode("utf-8"),
+                "tokens": tokens,
+                "pos": [[token, tag] for token, tag in zip(tokens, tags)],
+                "doc_id": int(self._arrays["doc_ids"][index]),
+                "sentence_id": sentence_id,
+                "word_count": len(tokens),
+            })
+        input_info["inputs"] = inputs
+        return input_info
+
+    def get_labels_info(self, topic_id, kind):
+        """
+        Get the labels information of a topic
+
+        :param topic_id: id of the topic
+        :type topic_id: str
+        :param kind: kind of labels ("concept_based" or "sentence_based")
+        :type kind: str
+        :return: labels information (like stored in labels-*/)
+        :rtype: dict[str]
+        """
+        topic = self.topics[topic_id]
+        first_sentence = topic["first_sentence"]
+        labels = self._arrays["labels_" + kind][first_sentence:first_sentence + topic["sentence_count"]]
+        return {"id": topic_id, **topic["labels"][kind], "labels": labels.tolist()}
+
+
+def convert_json_corpus(wiki_name, experiment):
+    """
+    Convert the inputs and labels of an experiment from the json files to a packed corpus
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param experiment: name of the experiment
+    :type experiment: str
+    """
+    path_experiment = path.join(get_base_path(wiki_name), experiment)
+    path_inputs = path.join(path_experiment, "inputs")
+    topic_count = 0
+    with PackedCorpusWriter(get_packed_path(wiki_name, experiment)) as writer:
+        for file in sorted(listdir(path_inputs)):
+            if not file.endswith(".json"):
+                continue
+            with open(path.join(path_inputs, file), "r") as input_file:
+                input_info = json.load(input_file)
+            labels_infos = {}
+            for kind in LABEL_KINDS:
+                with open(path.join(path_experiment, "labels-" + kind.replace("_", "-"), file), "r") as labels_file:
+                    labels_infos[kind] = json.load(labels_file)
+            writer.add_topic(input_info, labels_infos)
+            topic_count += 1
+    print(f"Converted {topic_count} topics with {writer.sentence_count} sentences")
+
+
+if __name__ == "__main__":
+    wiki_name = sys.argv[1]
+    experiment = sys.argv[2] if len(sys.argv) > 2 else 'qf-mds'
+
+    convert_json_corpus(wiki_name, experiment)
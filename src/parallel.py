@@ -0,0 +1,51 @@
+from collections import deque
+from itertools import islice
+
+
+def _apply_to_chunk(func, chunk):
+    """
+    Apply a function to all items of a chunk (executed in a worker process)
+
+    :param func: function to apply
+    :type func: Callable
+    :param chunk: list of items
+    :type chunk: list
+    :return: list of results
+    :rtype: list
+    """
+    return [func(item) for item in chunk]
+
+
+def imap_bounded(pool, func, iterable, chunk_size=1, max_pending=None):
+    """
+    Ordered, chunked equivalent of Pool.imap that only reads ahead a bounded number of chunks
+
+    Pool.imap consumes its input eagerly, which would pull e.g. a whole dump into memory when the input is a stream.
+
+    :param pool: pool of worker processes
+    :type pool: multiprocessing.pool.Pool
+    :param func: function to apply (has to be picklable)
+    :type func: Callable
+    :param iterable: input items
+    :type iterable: Iterable
+    :param chunk_size: number of items handed to a worker at once
+    :type chunk_size: int
+    :param max_pending: maximum number of chunks in flight (defaults to twice the number of workers)
+    :type max_pending: int
+    :return: generator of results (in the order of the input items)
+    :rtype: Iterator
+    """
+    if max_pending is None:
+        max_pending = 2 * pool._processes
+
+    iterator = iter(iterable)
+    pending = deque()
+    while True:
+        while len(pending) < max_pending:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            pending.append(pool.apply_async(_apply_to_chunk, (func, chunk)))
+        if not pending:
+            return
+        yield from pending.popleft().get()
@@ -1,3 +1,4 @@
+import hashlib
 import html
 import json
 import re
@@ -5,10 +6,25 @@ import sys
 import nltk
 import logging
 
-import shutil
 import wikitextparser as wtp
+# Internals of wikitextparser needed to reproduce its html tag detection in the spans cleanup engine (only verified
+# for the version pinned in requirements.txt, see SPANS_ENGINE_WTP_VERSION)
+try:
+    from wikitextparser._spans import parse_to_spans
+    from wikitextparser._wikitext import START_TAG_FINDITER, END_TAG_PATTERN, search as wtp_search
+except ImportError:
+    parse_to_spans = None
 import xml.etree.ElementTree as ET
-from os import path, listdir, makedirs
+from bisect import bisect_left
+from multiprocessing import Pool
+from os import path, listdir, makedirs, replace
+
+import article_store
+from article_store import store_article, load_article, remove_article, list_articles, iter_stored_articles, \
+    close_store
+from dump_reader import find_dump, open_dump
+from parallel import imap_bounded
+from profiling import count, timer
 
 
 DATA_PATH = "../data"
@@ -19,16 +35,51 @@ XML_IGNORE += ['Datei:', 'Hilfe:', 'Benutzer', 'Benutzer Diskussion:', 'Kategori
 XML_ARTICLE_NAMESPACE = 0
 XML_RESTRICT_TO_ARTICLE_NAMESPACE = True
 
+# Parse dumps incrementally (page by page) instead of loading the whole tree into memory
+STREAM_DUMP = True
+
+# Number of processes used for parsing the articles (and number of articles handed to a process at once)
+PARSE_WORKERS = 1
+PARSE_CHUNK_SIZE = 64
+
+# Engine for removing templates and html tags from sections: "spans" (cut out all spans in one pass) or "wtp" (delete
+# them one by one with wikitextparser, the spans engine falls back to it for the rare cases it cannot reproduce exactly)
+CLEANUP_ENGINE = "spans"
+
+# The spans engine is only used for articles with at least this many characters (it is only faster on heavy articles,
+# all others are cleaned with the wtp engine as reference, check both with "python benchmark.py cleanup")
+SPANS_ENGINE_MIN_LENGTH = 8192
+
+# Version of wikitextparser the spans engine reproduces exactly, with any other version the wtp engine is used
+SPANS_ENGINE_WTP_VERSION = "0.24.3"
+SPANS_ENGINE_SUPPORTED = parse_to_spans is not None and getattr(wtp, "__version__", None) == SPANS_ENGINE_WTP_VERSION
+if not SPANS_ENGINE_SUPPORTED:
+    logging.warning(f"The spans cleanup engine needs wikitextparser {SPANS_ENGINE_WTP_VERSION} "
+                    f"(found {getattr(wtp, '__version__', 'unknown')}), sections are cleaned with the wtp engine")
+
+# Store the tokens of the parsed sections and the per-sentence tokens (and POS tags) of the whole article, so that
+# later stages do not need to tokenize again (tokenized exactly like assign would do it, so the results are unchanged)
+STORE_TOKENS = False
+STORE_POS = False
+
+# Only extract and parse articles that changed since the last run (based on a manifest of revisions)
+INCREMENTAL_PARSE = False
+
+# Extract and parse articles in a single pass (instead of writing and re-reading intermediate raw json files)
+FUSE_EXTRACT_AND_PARSE = True
+
 TEXT_CLEAN_SECTIONS_IGNORE = ["Sources", "__NOWYSIWYG__", "See also"]
 
 # Ignore sentences/lines with markup (e.g., bullet point lists, tables, ...)
-BAD_SENTENCE_PREFIXES = ['*', '|','Category:', '#', '!', '{', 'align', 'width', ']]']
+BAD_SENTENCE_PREFIXES = ('*', '|', 'Category:', '#', '!', '{', 'align', 'width', ']]')
 
 # Prepare filename cleaning
 filename_cleaner = re.compile(r'[^a-zA-Z0-9 ()_-]')
 
 # Prepare text cleaning
 comment_cleaner = re.compile(r'<!--.*?-->')
+file_link_cleaner = re.compile(r"\[\[(File:|Image:)([^\]]+)\]\]")
+link_cleaner = re.compile(r"\[\[([^|\]]*\|)?([^\]]+)\]\]")
 
 
 def get_base_path(wiki_name):
@@ -75,14 +126,10 @@ def get_article_json(article_name, wiki_name):
     :return: json object representing the article
     :rtype: Dict[str]
     """
-    filename = path.join(get_article_path(wiki_name), article_name + ".json")
-    try:
-        with open(filename, "r") as file:
-            article_info = json.load(file)
-            return article_info
-    except FileNotFoundError:
-        logging.warning(f"File {filename} not found")
-        return None
+    article_info = load_article(get_article_path(wiki_name), article_name)
+    if article_info is None:
+        logging.warning(f"Article {article_name} not found")
+    return article_info
 
 
 def get_article_text(article_name, wiki_name, article_info = None):
@@ -110,6 +157,24 @@ def get_article_text(article_name, wiki_name, article_info = None):
     return "\n".join(section["text"] for section in article_info["sections"])
 
 
+def get_article_sentences(article_info):
+    """
+    Get all sentences of a given article with their stored tokens and POS tags
+
+    :param article_info: article information dict
+    :type article_info: dict[str]
+    :return: list of (sentence, tokens, POS tags (None if not stored)) tuples, None if there are no stored tokens
+    :rtype: list[tuple[str, list[str], list[tuple[str, str]]]]
+    """
+    if article_info is None or "sentence_tokens" not in article_info:
+        return None
+
+    text = "\n".join(section["text"] for section in article_info["sections"])
+    pos = article_info.get("sentence_pos")
+    return [(text[start:end], tokens, list(zip(tokens, pos[i])) if pos is not None else None)
+            for i, ((start, end), tokens) in enumerate(zip(article_info["sentences"], article_info["sentence_tokens"]))]
+
+
 def adapt_ignores(wiki_prefix):
     """
     Adapt list of ignores based on given wiki prefix
@@ -126,94 +191,252 @@ def adapt_ignores(wiki_prefix):
     return xml_ignore_adapted
 
 
-def extract_articles(wiki_name, wiki_prefix):
+def compile_ignores(ignores):
     """
-    Parse wikia dump into json files
+    Combine a list of ignores into one regular expression matching any of them as prefix
+
+    :param ignores: prefixes to ignore
+    :type ignores: Iterable[str]
+    :return: compiled pattern
+    :rtype: re.Pattern
+    """
+    return re.compile("|".join(re.escape(ignore) for ignore in sorted(ignores)))
+
+
+def iter_dump_pages(dump_file, streaming=True):
+    """
+    Iterate over all page elements of a given mediawiki dump
+
+    In streaming mode, the dump is parsed incrementally and every page element is cleared after it was handled,
+    hence memory usage stays flat independent of the dump size.
+
+    :param dump_file: path or file object of the dump
+    :type dump_file: str
+    :param streaming: parse dump incrementally instead of loading the whole tree into memory
+    :type streaming: bool
+    :return: generator of page elements
+    :rtype: Iterator[xml.etree.ElementTree.Element]
+    """
+    if not streaming:
+        yield from ET.parse(dump_file).getroot().findall(XML_NAMESPACE + 'page')
+        return
+
+    page_tag = XML_NAMESPACE + 'page'
+    root = None
+    for event, element in ET.iterparse(dump_file, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            continue
+
+        if element.tag == page_tag:
+            yield element
+            # Free the page (and the reference the root still holds to it)
+            element.clear()
+            root.clear()
+
+
+def get_dump_path(wiki_name):
+    """
+    Get path of the (possibly compressed) dump for a given wiki
 
     :param wiki_name: name of the wikia dump to parse
     :type wiki_name: str
+    :return: path of the dump
+    :rtype: str
+    """
+    return find_dump(path.join(DATA_PATH, "wikiadumps"), wiki_name)
+
+
+def _get_revision_key(revision_node, text):
+    """
+    Get a key identifying the revision of a page (revision id and content hash)
+
+    :param revision_node: revision element of the page
+    :type revision_node: xml.etree.ElementTree.Element
+    :param text: raw text of the revision
+    :type text: str
+    :return: revision key
+    :rtype: str
+    """
+    revision_id = revision_node.findtext(XML_NAMESPACE + 'id')
+    sha1 = revision_node.findtext(XML_NAMESPACE + 'sha1')
+    if not sha1:
+        sha1 = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return f"{revision_id}:{sha1}"
+
+
+def iter_articles(dump_path, wiki_prefix, streaming=STREAM_DUMP, previous_revisions=None, revisions=None):
+    """
+    Iterate over all articles of a given wikia dump
+
+    For incremental runs, pass the revisions of the last run and an empty dict that will be filled with the revisions
+    of all articles in this dump. Articles whose revision did not change are skipped.
+
+    :param dump_path: path of the dump (.xml, .xml.bz2, .xml.gz, .xml.xz or - for stdin)
+    :type dump_path: str
     :param wiki_prefix: prefix for special pages of this wiki (will be ingored)
     :type wiki_prefix: str
+    :param streaming: parse dump incrementally instead of loading the whole tree into memory
+    :type streaming: bool
+    :param previous_revisions: revision keys of the last run (cleaned title -> revision key)
+    :type previous_revisions: dict[str, str]
+    :param revisions: dict to collect the revision keys of all articles of this dump in
+    :type revisions: dict[str, str]
+    :return: generator of article information dicts (with raw text)
+    :rtype: Iterator[dict[str]]
     """
     # Adapt ingore list
-    xml_ignore_adapted = adapt_ignores(wiki_prefix)
+    xml_ignore_matcher = compile_ignores(adapt_ignores(wiki_prefix))
 
-    # Prepare output
-    output_path = get_article_path(wiki_name)
-    makedirs(output_path, exist_ok=True)
+    if dump_path != "-":
+        count("dump_bytes", path.getsize(dump_path))
 
-    # Parse wikia database dump
-    print("Reading dump...")
-    tree = ET.parse(DATA_PATH + "/wikiadumps/" + wiki_name + ".xml")
-    wikia_dump = tree.getroot()
+    with open_dump(dump_path) as dump_file:
+        for page in iter_dump_pages(dump_file, streaming):
+            count("pages")
 
-    article_count = 0
-    # Extract articles from dump
-    print("Extracting articles...")
-    for page in wikia_dump.findall(XML_NAMESPACE + 'page'):
-        # Ignore redirect pages
-        redirect_node = page.find(XML_NAMESPACE + 'redirect')
-        if redirect_node is not None:
-            continue
+            # Ignore redirect pages
+            redirect_node = page.find(XML_NAMESPACE + 'redirect')
+            if redirect_node is not None:
+                continue
+
+            if XML_RESTRICT_TO_ARTICLE_NAMESPACE:
+                # Only extract from a certain namespace
+                namespace = page.find(XML_NAMESPACE + 'ns')
+                if int(namespace.text) != XML_ARTICLE_NAMESPACE:
+                    continue
 
-        if XML_RESTRICT_TO_ARTICLE_NAMESPACE:
-            # Only extract from a certain namespace
-            namespace = page.find(XML_NAMESPACE + 'ns')
-            if int(namespace.text) != XML_ARTICLE_NAMESPACE:
+            # Ignore special pages
+            title_node = page.find(XML_NAMESPACE + 'title')
+            title = title_node.text
+            if xml_ignore_matcher.match(title):
                 continue
 
-        # Ignore special pages
-        title_node = page.find(XML_NAMESPACE + 'title')
-        title = title_node.text
-        if any(title.startswith(ignore_string) for ignore_string in xml_ignore_adapted):
-            continue
+            # Extract raw text
+            revision_node = page.find(XML_NAMESPACE + 'revision')
+            text = revision_node.find(XML_NAMESPACE + 'text').text
+
+            # Ignore articles without text
+            if text is not None:
+                # Create filename from title
+                cleaned_title = get_clean_filename(title)
+                id = page.find(XML_NAMESPACE + 'id').text
 
-        # Extract raw text
-        text = page.find(XML_NAMESPACE + 'revision').find(XML_NAMESPACE + 'text').text
+                if revisions is not None:
+                    # Skip articles that did not change since the last run
+                    revision_key = _get_revision_key(revision_node, text)
+                    revisions[cleaned_title] = revision_key
+                    if previous_revisions is not None and previous_revisions.get(cleaned_title) == revision_key:
+                        continue
 
-        # Ignore articles without text
-        if text is not None:
-            print(title)
-            # Create filename from title
-            cleaned_title = get_clean_filename(title)
-            id = page.find(XML_NAMESPACE + 'id').text
+                # Make sure the __NOWYSIWYG__ area is treated as a section
+                text = text.replace("__NOWYSIWYG__", "==__NOWYSIWYG__==")
 
-            # Make sure the __NOWYSIWYG__ area is treated as a section
-            text = text.replace("__NOWYSIWYG__", "==__NOWYSIWYG__==")
+                count("articles")
+                count("raw_text_chars", len(text))
 
-            info = {
-                "id": id,
-                "title": title,
-                "cleaned_title": cleaned_title,
-                "raw_text": text}
+                yield {
+                    "id": id,
+                    "title": title,
+                    "cleaned_title": cleaned_title,
+                    "raw_text": text}
 
-            with open(path.join(output_path, cleaned_title + ".json"), "w") as output_file:
-                json.dump(info, output_file, indent=2)
-            article_count += 1
+
+def extract_articles(wiki_name, wiki_prefix, streaming=STREAM_DUMP, dump_path=None):
+    """
+    Parse wikia dump into json files
+
+    :param wiki_name: name of the wikia dump to parse
+    :type wiki_name: str
+    :param wiki_prefix: prefix for special pages of this wiki (will be ingored)
+    :type wiki_prefix: str
+    :param streaming: parse dump incrementally instead of loading the whole tree into memory
+    :type streaming: bool
+    :param dump_path: path of the dump (.xml, .xml.bz2, .xml.gz, .xml.xz or - for stdin), determined from the wiki name if not given
+    :type dump_path: str
+    """
+    if dump_path is None:
+        dump_path = get_dump_path(wiki_name)
+
+    # Prepare output
+    output_path = get_article_path(wiki_name)
+    makedirs(output_path, exist_ok=True)
+
+    article_count = 0
+    # Extract articles from dump
+    print("Extracting articles...")
+    for info in iter_articles(dump_path, wiki_prefix, streaming):
+        print(info["title"])
+        with timer("io"):
+            store_article(output_path, info)
+        article_count += 1
+    with timer("io"):
+        close_store(output_path)
 
     print(f"Extracted {article_count} articles\n")
 
 
-def _parse_sections(parsed_text, ignores, language='english'):
+def _get_sentence_offsets(text, sentences):
     """
-    Parse sections of a given parsed raw text
+    Determine start and end offsets of the given sentences in their text
+
+    :param text: text the sentences were taken from
+    :type text: str
+    :param sentences: list of sentences (in the order of the text)
+    :type sentences: list[str]
+    :return: list of (start, end) offsets
+    :rtype: list[list[int]]
+    """
+    offsets = []
+    start = 0
+    for sent in sentences:
+        start = text.index(sent, start)
+        offsets.append([start, start + len(sent)])
+        start += len(sent)
+    return offsets
 
-    :param parsed_text: raw text parsed with wikitextparser
-    :type parsed_text: wikitextparser.WikiText
+
+def _add_article_tokens(info, language):
+    """
+    Add the sentences of the text of a parsed article with their tokens (and POS tags) to its info object
+
+    The article text is split and tokenized exactly like assign does it for the input representation of a source
+    document (so the sentence boundaries between sections are the same).
+
+    :param info: parsed article information dict
+    :type info: dict[str]
     :param language: language of this wiki
     :type language: str
-    :return: list of section info objects
-    :rtype: list[dict]
     """
-    parsed_sections = []
+    with timer("tokenization"):
+        text = "\n".join(section["text"] for section in info["sections"])
+        sentences = nltk.sent_tokenize(text, language)
+        sentence_tokens = [nltk.word_tokenize(sent, language) for sent in sentences]
+    info["sentences"] = _get_sentence_offsets(text, sentences)
+    info["sentence_tokens"] = sentence_tokens
+    if STORE_POS:
+        # Tagged exactly like assign does (the short language is passed as tagset), so the stored tags can be used for
+        # the inputs
+        info["sentence_pos"] = [[tag for _, tag in tagged_sent] for tagged_sent in nltk.pos_tag_sents(sentence_tokens, language[:3])]
+
+
+def _clean_sections_wtp(parsed_text, ignores):
+    """
+    Clean all relevant sections of a given parsed raw text by deleting templates and html tags with wikitextparser
 
-    # Extract text and other information for all sections
-    # (and ignore certain sections (that do not hold textual information)
+    :param parsed_text: raw text parsed with wikitextparser (will be modified)
+    :type parsed_text: wikitextparser.WikiText
+    :param ignores: links to ignore (prefixes, see compile_ignores)
+    :type ignores: re.Pattern
+    :return: generator of title, level, links and cleaned contents of all relevant sections
+    :rtype: Iterator[tuple[str, int, list[str], str]]
+    """
     for section in parsed_text.sections:
         if section.title not in TEXT_CLEAN_SECTIONS_IGNORE and section.contents != "":
             # Extract all links (potential source documents from the section text)
             # but ignore links to ignored page categories
-            section_links = list(set(wl.target for wl in section.wikilinks if all(not(wl.target.startswith(s)) for s in ignores)))
+            section_links = list(set(wl.target for wl in section.wikilinks if not ignores.match(wl.target)))
 
             # Clean text for further usage
             # Remove all templates and html tags (mainly ref links)
@@ -227,52 +450,435 @@ def _parse_sections(parsed_text, ignores, language='english'):
                     del html_tag[:]
                 except IndexError:
                     pass
-            section_text = section.contents
-
-            # Ignore subsections
-            subsection_equal_string = "=" * (section.level + 1)
-            begin_subsection_index = section_text.find(subsection_equal_string)
-            if begin_subsection_index > -1:
-                section_text = section_text[:begin_subsection_index]
-
-            # Remove all file and image links:
-            section_text = re.sub(r"\[\[(File:|Image:)([^\]]+)\]\]", r"", section_text)
-            # Replace all links with their link texts:
-            section_text = re.sub(r"\[\[([^|\]]*\|)?([^\]]+)\]\]", r"\2", section_text)
-
-            # Remove special chars and unneeded whitespace
-            section_text = section_text.replace("'''", "")
-            section_text = section_text.strip()
-
-            # Unescape html chars
-            section_text = html.unescape(section_text)
-
-            # Remove empty lines, lists of bullet points, tables and other unwanted markup
-            # (although they might be interesting for some applications we are mainly interested in running text)
-            section_sentences = [sent.strip() for sent in nltk.sent_tokenize(section_text, language=language) if sent.strip() != "" and not any(sent.startswith(prefix) for prefix in BAD_SENTENCE_PREFIXES)]
-
-            # Make sure there is still content left after cleaning...
-            if len(section_sentences) > 0:
-                cleaned_text = "\n".join(section_sentences)
-                # section_tokens = nltk.word_tokenize(cleaned_text)
-                # ... compile all necessary information...
-                section_info = {
-                    "title": section.title,
-                    "length": len(nltk.word_tokenize(cleaned_text, language=language)),
-                    "links": section_links,
-                    # Store each sentence in a new line (required by many summarization systems)
-                    "text": cleaned_text,
-                    # "tokens": section_tokens
-                }
-                # ... and store it
-                parsed_sections.append(section_info)
+
+            yield section.title, section.level, section_links, section.contents
+
+
+def _add_span(spans, start, end):
+    """
+    Add a span to a sorted list of disjoint spans (merging overlapping and adjacent spans)
+
+    :param spans: sorted list of disjoint spans
+    :type spans: list[tuple[int, int]]
+    :param start: start of the span
+    :type start: int
+    :param end: end of the span
+    :type end: int
+    """
+    if start >= end:
+        return
+    index = bisect_left(spans, (start, start))
+    # Merge with overlapping predecessor...
+    if index > 0 and spans[index - 1][1] >= start:
+        index -= 1
+        start = spans[index][0]
+        end = max(end, spans[index][1])
+    # ... and all overlapping successors
+    last = index
+    while last < len(spans) and spans[last][0] <= end:
+        end = max(end, spans[last][1])
+        last += 1
+    spans[index:last] = [(start, end)]
+
+
+def _find_span(spans, position):
+    """
+    Find the span containing a position in a sorted list of disjoint spans
+
+    :param spans: sorted list of disjoint spans
+    :type spans: list[tuple[int, int]]
+    :param position: position to look for
+    :type position: int
+    :return: span containing the position (None if there is no such span)
+    :rtype: tuple[int, int]
+    """
+    index = bisect_left(spans, (position + 1,))
+    if index > 0 and spans[index - 1][1] > position:
+        return spans[index - 1]
+    return None
+
+
+def _is_removed(spans, position):
+    """
+    Check whether a position lies within a sorted list of disjoint spans
+
+    :param spans: sorted list of disjoint spans
+    :type spans: list[tuple[int, int]]
+    :param position: position to check
+    :type position: int
+    :return: True if the position is covered by a span
+    :rtype: bool
+    """
+    return _find_span(spans, position) is not None
+
+
+def _intersects(spans, start, end):
+    """
+    Check whether a range intersects a sorted list of disjoint spans
+
+    :param spans: sorted list of disjoint spans
+    :type spans: list[tuple[int, int]]
+    :param start: start of the range
+    :type start: int
+    :param end: end of the range
+    :type end: int
+    :return: True if any position of the range is covered by a span
+    :rtype: bool
+    """
+    index = bisect_left(spans, (start + 1,))
+    if index > 0 and spans[index - 1][1] > start:
+        return True
+    return index < len(spans) and spans[index][0] < end
+
+
+def _remove_spans(string, start, end, spans):
+    """
+    Get a range of a string with all given spans removed
+
+    :param string: complete string
+    :type string: str
+    :param start: start of the range
+    :type start: int
+    :param end: end of the range
+    :type end: int
+    :param spans: sorted list of disjoint spans to remove
+    :type spans: list[tuple[int, int]]
+    :return: cleaned range
+    :rtype: str
+    """
+    pieces = []
+    position = start
+    index = bisect_left(spans, (start, start))
+    if index > 0:
+        index -= 1
+    for span_start, span_end in spans[index:]:
+        if span_start >= end:
+            break
+        if span_end <= position:
+            continue
+        if span_start > position:
+            pieces.append(string[position:span_start])
+        position = max(position, span_end)
+    if position < end:
+        pieces.append(string[position:end])
+    return "".join(pieces)
+
+
+def _to_current_position(spans, position):
+    """
+    Translate a position in the original string to the string with the given spans removed
+
+    :param spans: sorted list of disjoint removed spans
+    :type spans: list[tuple[int, int]]
+    :param position: position in the original string
+    :type position: int
+    :return: position in the cleaned string
+    :rtype: int
+    """
+    shift = 0
+    for start, end in spans:
+        if start >= position:
+            break
+        shift += min(end, position) - start
+    return position - shift
+
+
+def _to_original_position(spans, position):
+    """
+    Translate a position in the string with the given spans removed to the original string
+
+    :param spans: sorted list of disjoint removed spans
+    :type spans: list[tuple[int, int]]
+    :param position: position in the cleaned string
+    :type position: int
+    :return: position of the same character in the original string
+    :rtype: int
+    """
+    for start, end in spans:
+        if start > position:
+            break
+        position += end - start
+    return position
+
+
+def _shrink_tag_spans(tag_spans, start, end):
+    """
+    Update the html tag spans after a deletion exactly like wikitextparser (0.24.3) does
+
+    wikitextparser's update assumes a sorted list of spans, but tags() appends the spans of html tags in reversed
+    order. The resulting (shifted) spans of the following tags are part of the output of the wikitextparser engine,
+    so they have to be reproduced.
+
+    :param tag_spans: spans of html tags in the current string (same order as in wikitextparser, will be modified)
+    :type tag_spans: list[list[int]]
+    :param start: start of the deleted range in the current string
+    :type start: int
+    :param end: end of the deleted range in the current string
+    :type end: int
+    """
+    i = len(tag_spans) - 1
+    while i >= 0:
+        s, e = span = tag_spans[i]
+        if end <= s:
+            span[:] = s - (end - start), e - (end - start)
+            i -= 1
+            continue
+        break
+    else:
+        return
+    while True:
+        if start <= s:
+            if end < e:
+                span[:] = start, e + start - end
+            else:
+                tag_spans.pop(i)[:] = -1, -1
+            i -= 1
+            if i < 0:
+                return
+            s, e = span = tag_spans[i]
+            continue
+        break
+    while i >= 0:
+        if e > start:
+            span[1] -= end - start
+        i -= 1
+        if i < 0:
+            return
+        s, e = span = tag_spans[i]
+
+
+def _find_html_tags(section_string, section_start, tag_spans):
+    """
+    Find the html tags in a section like wikitextparser's tags() does
+
+    :param section_string: current string of the section
+    :type section_string: str
+    :param section_start: start of the section in the current string
+    :type section_start: int
+    :param tag_spans: spans of html tags found before (new spans will be appended)
+    :type tag_spans: list[list[int]]
+    :return: spans of the html tags in the section (may be shared with tag_spans)
+    :rtype: list[list[int]]
+    """
+    shadow = bytearray(section_string, 'ascii', 'replace')
+    parse_to_spans(shadow)
+    shadow_copy = shadow[:]
+    known_spans = {(span[0], span[1]): span for span in tag_spans}
+
+    found_spans = []
+    # Match the right-most start tag first (to the first fitting end tag in the section)
+    for start_match in reversed(list(START_TAG_FINDITER(shadow))):
+        if start_match['self_closing']:
+            span = [section_start + start_match.start(), section_start + start_match.end()]
+        else:
+            end_match = wtp_search(END_TAG_PATTERN.replace(b'{name}', start_match['name']), shadow_copy)
+            if end_match:
+                s, e = end_match.span()
+                shadow_copy[s:e] = b'_' * (e - s)
+                span = [section_start + start_match.start(), section_start + e]
+            else:
+                span = [section_start + start_match.start(), section_start + start_match.end()]
+        if (span[0], span[1]) in known_spans:
+            span = known_spans[(span[0], span[1])]
+        else:
+            tag_spans.append(span)
+        found_spans.append(span)
+    return found_spans
+
+
+def _clean_sections_spans(parsed_text, ignores):
+    """
+    Clean all relevant sections of a given parsed raw text by cutting out the spans of templates and html tags
+
+    Produces the same results as _clean_sections_wtp without modifying the parsed text (which makes wikitextparser
+    update all spans after every deletion). All deletions are tracked as spans of the original string, since a section
+    also contains its subsections (and tags() returns the extension tags of the whole page), the deletions made while
+    cleaning a section apply to the following sections as well.
+
+    :param parsed_text: raw text parsed with wikitextparser (root node)
+    :type parsed_text: wikitextparser.WikiText
+    :param ignores: links to ignore (prefixes, see compile_ignores)
+    :type ignores: re.Pattern
+    :return: title, level, links and cleaned contents of all relevant sections
+             (None if the results might differ from _clean_sections_wtp)
+    :rtype: list[tuple[str, int, list[str], str]]
+    """
+    string = parsed_text.string
+    extension_tags = [tuple(span) for span in parsed_text._type_to_spans.get('ExtensionTag', [])]
+    removed_spans = []
+    tag_spans = []
+    cleaned_sections = []
+
+    def is_cut(start, end):
+        # Deletions crossing the boundary of an element leave wikitextparser with broken spans
+        return _is_removed(removed_spans, start) != _is_removed(removed_spans, end - 1)
+
+    def delete(start, end):
+        # Delete a range of the current string (the html tag spans are kept in current positions)
+        if tag_spans:
+            _shrink_tag_spans(tag_spans, start, end)
+        if start < end:
+            _add_span(removed_spans, _to_original_position(removed_spans, start),
+                      _to_original_position(removed_spans, end - 1) + 1)
+
+    def delete_original(start, end):
+        # Delete an (intact) element given by its span in the original string
+        if tag_spans:
+            delete(_to_current_position(removed_spans, start), _to_current_position(removed_spans, end))
+        else:
+            _add_span(removed_spans, start, end)
+
+    def get_section_parts(section_start, section_end, contents_start, title, level):
+        # Title, level and contents of a section in the current string
+        if not _intersects(removed_spans, section_start, contents_start):
+            return title, level, _remove_spans(string, contents_start, section_end, removed_spans)
+        current_section = wtp.Section(_remove_spans(string, section_start, section_end, removed_spans))
+        return current_section.title, current_section.level, current_section.contents
+
+    for section in parsed_text.sections:
+        section_start, section_end = section.span
+        contents_start = section_end - len(section.contents)
+        section_parts = section_start, section_end, contents_start, section.title, section.level
+
+        # A deletion reaching beyond the end of a section leaves wikitextparser with a wrong section end
+        end_span = _find_span(removed_spans, section_end - 1)
+        if end_span is not None and end_span[0] > section_start and end_span[1] > section_end:
+            return None
+
+        title, _, contents = get_section_parts(*section_parts)
+        if title in TEXT_CLEAN_SECTIONS_IGNORE or contents == "":
+            continue
+
+        # Extract all links (potential source documents from the section text) that were not deleted before
+        # but ignore links to ignored page categories
+        section_links = []
+        for wl in section.wikilinks:
+            start, end = wl.span
+            if is_cut(start, end):
+                return None
+            if _is_removed(removed_spans, start):
+                continue
+            target = wl.target
+            link_string = _remove_spans(string, start, end, removed_spans)
+            if len(link_string) != end - start:
+                # Parts of the link were deleted before
+                target = wtp.WikiLink(link_string).target
+            if not ignores.match(target):
+                section_links.append(target)
+        section_links = list(set(section_links))
+
+        # Remove all templates...
+        for template in section.templates:
+            start, end = template.span
+            if is_cut(start, end):
+                return None
+            if not _is_removed(removed_spans, start):
+                delete_original(start, end)
+
+        # ... and html tags (mainly ref links), including the extension tags of the whole page
+        # (in the order of their positions, which is the same in the original and the current string)
+        tags = []
+        for start, end in extension_tags:
+            if is_cut(start, end):
+                return None
+            if not _is_removed(removed_spans, start):
+                tags.append(((start, end), (start, end)))
+        for span in _find_html_tags(_remove_spans(string, section_start, section_end, removed_spans),
+                                    _to_current_position(removed_spans, section_start), tag_spans):
+            tags.append(((_to_original_position(removed_spans, span[0]),
+                          _to_original_position(removed_spans, span[1] - 1) + 1), span))
+        tags.sort(key=lambda tag: tag[0])
+
+        for _, span in tags:
+            if isinstance(span, tuple):
+                # Extension tags may have been deleted together with a preceding html tag
+                if is_cut(*span):
+                    return None
+                if not _is_removed(removed_spans, span[0]):
+                    delete_original(*span)
+            else:
+                # The spans of html tags are updated by the deletions (possibly into wrong ones)
+                start, end = span
+                if 0 <= start <= end:
+                    delete(start, end)
+        # All extension tags of the page are deleted now
+        extension_tags = []
+
+        title, level, section_text = get_section_parts(*section_parts)
+        cleaned_sections.append((title, level, section_links, section_text))
+
+    return cleaned_sections
+
+
+def _parse_sections(parsed_text, ignores, language='english'):
+    """
+    Parse sections of a given parsed raw text
+
+    :param parsed_text: raw text parsed with wikitextparser
+    :type parsed_text: wikitextparser.WikiText
+    :param ignores: links to ignore (prefixes, see compile_ignores)
+    :type ignores: re.Pattern
+    :param language: language of this wiki
+    :type language: str
+    :return: list of section info objects
+    :rtype: list[dict]
+    """
+    parsed_sections = []
+
+    # Extract text and other information for all sections
+    # (and ignore certain sections (that do not hold textual information)
+    cleaned_sections = None
+    if CLEANUP_ENGINE == "spans" and SPANS_ENGINE_SUPPORTED and len(parsed_text.string) >= SPANS_ENGINE_MIN_LENGTH:
+        cleaned_sections = _clean_sections_spans(parsed_text, ignores)
+    if cleaned_sections is None:
+        cleaned_sections = _clean_sections_wtp(parsed_text, ignores)
+
+    for section_title, section_level, section_links, section_text in cleaned_sections:
+        # Ignore subsections
+        subsection_equal_string = "=" * (section_level + 1)
+        begin_subsection_index = section_text.find(subsection_equal_string)
+        if begin_subsection_index > -1:
+            section_text = section_text[:begin_subsection_index]
+
+        # Remove all file and image links:
+        section_text = file_link_cleaner.sub(r"", section_text)
+        # Replace all links with their link texts:
+        section_text = link_cleaner.sub(r"\2", section_text)
+
+        # Remove special chars and unneeded whitespace
+        section_text = section_text.replace("'''", "")
+        section_text = section_text.strip()
+
+        # Unescape html chars
+        section_text = html.unescape(section_text)
+
+        # Remove empty lines, lists of bullet points, tables and other unwanted markup
+        # (although they might be interesting for some applications we are mainly interested in running text)
+        section_sentences = [sent.strip() for sent in nltk.sent_tokenize(section_text, language=language) if sent.strip() != "" and not sent.startswith(BAD_SENTENCE_PREFIXES)]
+
+        # Make sure there is still content left after cleaning...
+        if len(section_sentences) > 0:
+            cleaned_text = "\n".join(section_sentences)
+            section_tokens = nltk.word_tokenize(cleaned_text, language=language)
+            # ... compile all necessary information...
+            section_info = {
+                "title": section_title,
+                "length": len(section_tokens),
+                "links": section_links,
+                # Store each sentence in a new line (required by many summarization systems)
+                "text": cleaned_text,
+            }
+            if STORE_TOKENS:
+                section_info["word_tokens"] = section_tokens
+            # ... and store it
+            parsed_sections.append(section_info)
 
     return parsed_sections
 
 
 def get_article_jsons(wiki_name):
     """
-    Get all article json files for a given wiki
+    Get all article json files for a given wiki (only for the files backend of the article store)
     :param wiki_name: name of the wiki
     :type wiki_name: str
     :return: list of all matching file paths
@@ -282,7 +888,135 @@ def get_article_jsons(wiki_name):
     return [path.join(raw_path, file) for file in listdir(raw_path) if file.endswith(".json")]
 
 
-def parse_texts(wiki_name, wiki_prefix, language='english'):
+def get_article_names(wiki_name):
+    """
+    Get the names (cleaned titles) of all articles for a given wiki
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :return: list of article names
+    :rtype: list[str]
+    """
+    return list_articles(get_article_path(wiki_name))
+
+
+def iter_article_jsons(wiki_name):
+    """
+    Iterate over all articles for a given wiki
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :return: generator of json objects representing the articles
+    :rtype: Iterator[dict[str]]
+    """
+    return iter_stored_articles(get_article_path(wiki_name))
+
+
+def parse_article(info, ignores, language='english'):
+    """
+    Parse the raw text of a given article and add categories and sections to its info object
+
+    :param info: article information dict (with raw text)
+    :type info: dict[str]
+    :param ignores: links to ignore (prefixes, see compile_ignores)
+    :type ignores: re.Pattern
+    :param language: language of this wiki
+    :type language: str
+    :return: the given article information dict
+    :rtype: dict[str]
+    """
+    # Parsing in worker processes is not measured (the timer only works in the process running the stage)
+    with timer("parsing"):
+        # Do basic pre-processing of raw text
+        raw_text = comment_cleaner.sub("", info['raw_text'])
+        # Parse raw text using wikitextparser
+        parsed_text = wtp.parse(raw_text)
+
+        # Determine and store categories
+        info["categories"] = [wl.target[9:] for wl in parsed_text.wikilinks if wl.target.startswith("Category")]
+
+        # Extract text and other information for all sections
+        # (and ignore certain sections (that do not hold text)
+        parsed_sections = _parse_sections(parsed_text, ignores, language)
+
+    # Store information about parsed sections (and clear it if already present)
+    info['sections'] = parsed_sections
+    for key in ["sentences", "sentence_tokens", "sentence_pos"]:
+        info.pop(key, None)
+    if STORE_TOKENS:
+        _add_article_tokens(info, language)
+
+    return info
+
+
+# Settings of the current parse worker process
+_worker_article_path = None
+_worker_ignores = None
+_worker_language = None
+
+
+def _init_parse_worker(article_path, ignores, language):
+    """
+    Initialize a parse worker (load tokenizer models only once per process)
+
+    :param article_path: folder of the article store
+    :type article_path: str
+    :param ignores: links to ignore (prefixes, see compile_ignores)
+    :type ignores: re.Pattern
+    :param language: language of this wiki
+    :type language: str
+    """
+    global _worker_article_path, _worker_ignores, _worker_language
+    _worker_article_path = article_path
+    _worker_ignores = ignores
+    _worker_language = language
+    nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+
+
+def _parse_stored_article(article_name):
+    """
+    Parse a given (extracted) article from the article store
+
+    :param article_name: name of the article
+    :type article_name: str
+    :return: parsed article information dict
+    :rtype: dict[str]
+    """
+    info = load_article(_worker_article_path, article_name)
+    return parse_article(info, _worker_ignores, _worker_language)
+
+
+def _store_parsed_articles(parsed_articles, article_path):
+    """
+    Write parsed articles to the article store (in the given order)
+
+    :param parsed_articles: parsed article information dicts
+    :type parsed_articles: Iterable[dict[str]]
+    :param article_path: folder of the article store
+    :type article_path: str
+    :return: number of articles with and without usable sections
+    :rtype: tuple[int, int]
+    """
+    article_count = 0
+    empty_count = 0
+    for info in parsed_articles:
+        print(info['title'])
+
+        with timer("io"):
+            if len(info['sections']) > 0:
+                article_count += 1
+                store_article(article_path, info)
+            else:
+                # Store empty articles separately
+                empty_count += 1
+                store_article(article_path, info, empty=True)
+
+    with timer("io"):
+        close_store(article_path)
+    count("parsed_articles", article_count)
+    count("empty_articles", empty_count)
+    return article_count, empty_count
+
+
+def parse_texts(wiki_name, wiki_prefix, language='english', workers=PARSE_WORKERS):
     """
     Parse raw texts for a given wiki (json files from extraction need to be present)
     :param wiki_name: name of the wikia dump to parse
@@ -291,44 +1025,150 @@ def parse_texts(wiki_name, wiki_prefix, language='english'):
     :type wiki_prefix: str
     :param language: language of this wiki
     :type language: str
+    :param workers: number of processes used for parsing
+    :type workers: int
     """
     # Process raw files
     print("Parsing raw text...")
 
-    ignores_list = list(adapt_ignores(wiki_prefix))
+    ignores = compile_ignores(adapt_ignores(wiki_prefix))
 
-    article_json_files = get_article_jsons(wiki_name)
+    article_path = get_article_path(wiki_name)
+    article_names = list_articles(article_path)
 
-    files_with_empty_sections_path = path.join(get_article_path(wiki_name), "empty")
+    if workers > 1:
+        with Pool(workers, initializer=_init_parse_worker, initargs=(article_path, ignores, language)) as pool:
+            _store_parsed_articles(pool.imap(_parse_stored_article, article_names, chunksize=PARSE_CHUNK_SIZE),
+                                   article_path)
+    else:
+        _init_parse_worker(article_path, ignores, language)
+        _store_parsed_articles(map(_parse_stored_article, article_names), article_path)
 
-    makedirs(files_with_empty_sections_path, exist_ok=True)
 
-    for article_json_filename in article_json_files:
-        with open(article_json_filename, "r") as article_json_file:
-            info = json.load(article_json_file)
-            print(info['title'])
+def _parse_article_info(info):
+    """
+    Parse a given (extracted) article
 
-            # Do basic pre-processing of raw text
-            raw_text = comment_cleaner.sub("", info['raw_text'])
-            # Parse raw text using wikitextparser
-            parsed_text = wtp.parse(raw_text)
+    :param info: article information dict (with raw text)
+    :type info: dict[str]
+    :return: parsed article information dict
+    :rtype: dict[str]
+    """
+    return parse_article(info, _worker_ignores, _worker_language)
 
-            # Determine and store categories
-            info["categories"] = [wl.target[9:] for wl in parsed_text.wikilinks if wl.target.startswith("Category")]
 
-            # Extract text and other information for all sections
-            # (and ignore certain sections (that do not hold text)
-            parsed_sections = _parse_sections(parsed_text, ignores_list, language)
+def _get_manifest_path(wiki_name):
+    """
+    Get path of the manifest of processed article revisions for a given wiki
 
-            # Store information about parsed sections (and clear it if already present)
-            info['sections'] = parsed_sections
+    :param wiki_name: name of the wikia dump to parse
+    :type wiki_name: str
+    :return: path of the manifest
+    :rtype: str
+    """
+    return path.join(get_base_path(wiki_name), "articles.manifest.json")
 
-        if len(info['sections']) > 0:
-            with open(article_json_filename, "w") as article_json_file:
-                json.dump(info, article_json_file, indent=2)
-        else:
-            # Move empty files to subfolder
-            shutil.move(article_json_filename, files_with_empty_sections_path)
+
+def _get_parse_settings(wiki_prefix, language):
+    """
+    Get all settings that influence the parsed articles (a change requires to parse all articles again)
+
+    :param wiki_prefix: prefix for special pages of this wiki (will be ingored)
+    :type wiki_prefix: str
+    :param language: language of this wiki
+    :type language: str
+    :return: settings
+    :rtype: dict[str]
+    """
+    return {
+        "wiki_prefix": wiki_prefix,
+        "language": language,
+        "store_tokens": STORE_TOKENS,
+        "store_pos": STORE_POS,
+        "article_store": article_store.ARTICLE_STORE_BACKEND,
+    }
+
+
+def extract_and_parse_articles(wiki_name, wiki_prefix, language='english', workers=PARSE_WORKERS,
+                               streaming=STREAM_DUMP, dump_path=None, incremental=INCREMENTAL_PARSE):
+    """
+    Extract and parse all articles of a given wiki in a single pass
+
+    Articles are streamed from the dump into the parser and every parsed article is written only once
+    (without the intermediate raw json files of extract_articles and parse_texts).
+    In incremental mode, only articles that are new or changed since the last run are processed
+    and articles no longer in the dump are removed.
+
+    :param wiki_name: name of the wikia dump to parse
+    :type wiki_name: str
+    :param wiki_prefix: prefix for special pages of this wiki (will be ingored)
+    :type wiki_prefix: str
+    :param language: language of this wiki
+    :type language: str
+    :param workers: number of processes used for parsing
+    :type workers: int
+    :param streaming: parse dump incrementally instead of loading the whole tree into memory
+    :type streaming: bool
+    :param dump_path: path of the dump (.xml, .xml.bz2, .xml.gz, .xml.xz or - for stdin), determined from the wiki name if not given
+    :type dump_path: str
+    :param incremental: only process articles that changed since the last run
+    :type incremental: bool
+    """
+    if dump_path is None:
+        dump_path = get_dump_path(wiki_name)
+
+    ignores = compile_ignores(adapt_ignores(wiki_prefix))
+
+    # Prepare output
+    output_path = get_article_path(wiki_name)
+    makedirs(output_path, exist_ok=True)
+
+    # Load revisions of the last run (unless settings have changed in between)
+    settings = _get_parse_settings(wiki_prefix, language)
+    previous_revisions = None
+    if incremental:
+        try:
+            with open(_get_manifest_path(wiki_name), "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest["settings"] == settings:
+                previous_revisions = manifest["revisions"]
+            else:
+                print("Parse settings changed, processing all articles")
+        except FileNotFoundError:
+            pass
+    revisions = dict()
+
+    print("Extracting and parsing articles...")
+    articles = iter_articles(dump_path, wiki_prefix, streaming, previous_revisions, revisions)
+
+    if workers > 1:
+        pool = Pool(workers, initializer=_init_parse_worker, initargs=(output_path, ignores, language))
+        parsed_articles = imap_bounded(pool, _parse_article_info, articles, PARSE_CHUNK_SIZE)
+    else:
+        pool = None
+        _init_parse_worker(output_path, ignores, language)
+        parsed_articles = map(_parse_article_info, articles)
+
+    try:
+        article_count, empty_count = _store_parsed_articles(parsed_articles, output_path)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    print(f"Extracted and parsed {article_count} articles ({empty_count} without usable sections)\n")
+
+    if incremental:
+        # Remove articles that are no longer part of the dump
+        if previous_revisions is not None:
+            deleted_articles = [cleaned_title for cleaned_title in previous_revisions if cleaned_title not in revisions]
+            for cleaned_title in deleted_articles:
+                remove_article(output_path, cleaned_title)
+            close_store(output_path)
+            print(f"Kept {len(revisions) - article_count - empty_count} unchanged articles, removed {len(deleted_articles)} deleted articles\n")
+
+        with open(_get_manifest_path(wiki_name) + ".tmp", "w") as manifest_file:
+            json.dump({"settings": settings, "revisions": revisions}, manifest_file)
+        replace(_get_manifest_path(wiki_name) + ".tmp", _get_manifest_path(wiki_name))
 
 
 if __name__ == "__main__":
@@ -338,7 +1178,14 @@ if __name__ == "__main__":
         language = sys.argv[3]
     else:
         language = "english"
+    if len(sys.argv) > 4:
+        workers = int(sys.argv[4])
+    else:
+        workers = PARSE_WORKERS
 
-    extract_articles(wiki_name, wiki_prefix)
-    parse_texts(wiki_name, wiki_prefix, language)
+    if FUSE_EXTRACT_AND_PARSE:
+        extract_and_parse_articles(wiki_name, wiki_prefix, language, workers)
+    else:
+        extract_articles(wiki_name, wiki_prefix)
+        parse_texts(wiki_name, wiki_prefix, language, workers)
 
@@ -0,0 +1,193 @@
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager
+from os import path, makedirs
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory is not reported there
+    resource = None
+
+
+# Dump a cProfile file per stage (only covers the main process, not the worker processes)
+PROFILE_STAGES = False
+
+# Report of the current run (None if no report is started)
+_report = None
+_current_stage = None
+
+
+def start_report(report_path, profile=PROFILE_STAGES, **info):
+    """
+    Start collecting timings and counters of the pipeline stages
+
+    :param report_path: path of the json report (cProfile files are stored next to it)
+    :type report_path: str
+    :param profile: dump a cProfile file per stage
+    :type profile: bool
+    :param info: additional information to store in the report (e.g., wiki name)
+    :type info: dict[str]
+    """
+    global _report
+    _report = {
+        "path": report_path,
+        "profile": profile,
+        "info": info,
+        "start": time.perf_counter(),
+        "stages": [],
+    }
+
+
+def _get_peak_rss():
+    """
+    Get the peak resident set size of this process and of its (terminated) child processes so far
+
+    :return: peak rss of this process and of the largest child process in MB (None if not available)
+    :rtype: tuple[float, float]
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss is given in kilobytes on Linux but in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit)
+
+
+@contextmanager
+def stage(name):
+    """
+    Measure a pipeline stage (wall and cpu time, peak memory and all counters and timers recorded during it)
+
+    Does nothing if no report was started.
+
+    :param name: name of the stage
+    :type name: str
+    """
+    global _current_stage
+    if _report is None:
+        yield
+        return
+
+    stage_info = {
+        "name": name,
+        "counters": {},
+        "timers": {},
+    }
+    profiler = None
+    if _report["profile"]:
+        profiler = cProfile.Profile()
+
+    _current_stage = stage_info
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        stage_info["seconds"] = time.perf_counter() - start
+        stage_info["cpu_seconds"] = time.process_time() - start_cpu
+        stage_info["peak_rss_mb"], stage_info["peak_children_rss_mb"] = _get_peak_rss()
+        # Throughput for all counters
+        if stage_info["seconds"] > 0:
+            stage_info["rates"] = {f"{counter}_per_second": value / stage_info["seconds"]
+                                   for counter, value in stage_info["counters"].items()}
+        _current_stage = None
+        _report["stages"].append(stage_info)
+
+        if profiler is not None:
+            profile_path = path.join(path.dirname(_report["path"]), "profiles")
+            makedirs(profile_path, exist_ok=True)
+            stage_info["profile"] = path.join(profile_path, name + ".prof")
+            profiler.dump_stats(stage_info["profile"])
+
+        write_report()
+
+
+def count(name, value=1):
+    """
+    Increase a counter of the current stage (does nothing outside of a stage)
+
+    :param name: name of the counter
+    :type name: str
+    :param value: value to add
+    :type value: int
+    """
+    if _current_stage is not None:
+        _current_stage["counters"][name] = _current_stage["counters"].get(name, 0) + value
+
+
+@contextmanager
+def timer(name):
+    """
+    Add the time spent in a block to a timer of the current stage (does nothing outside of a stage)
+
+    :param name: name of the timer
+    :type name: str
+    """
+    if _current_stage is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timers = _current_stage["timers"]
+        timers[name] = timers.get(name, 0) + time.perf_counter() - start
+
+
+def add_time(name, seconds):
+    """
+    Add time measured elsewhere (e.g., in a worker process) to a timer of the current stage (does nothing outside of a
+    stage)
+
+    :param name: name of the timer
+    :type name: str
+    :param seconds: time to add
+    :type seconds: float
+    """
+    if _current_stage is not None:
+        timers = _current_stage["timers"]
+        timers[name] = timers.get(name, 0) + seconds
+
+
+@contextmanager
+def collect():
+    """
+    Record the counters and timers of a block separately instead of in the current stage (also outside of a stage),
+    so that they can be returned from a worker process and added to the stage of the main process
+
+    :return: collected counters and timers (filled when the block is left)
+    :rtype: dict[str, dict[str, float]]
+    """
+    global _current_stage
+    previous_stage = _current_stage
+    collected = {"counters": {}, "timers": {}}
+    _current_stage = collected
+    try:
+        yield collected
+    finally:
+        _current_stage = previous_stage
+
+
+def write_report():
+    """
+    Write the report of the current run (does nothing if no report was started)
+    """
+    if _report is None:
+        return
+
+    report = {
+        **_report["info"],
+        "seconds": time.perf_counter() - _report["start"],
+        "stages": _report["stages"],
+    }
+    makedirs(path.dirname(_report["path"]), exist_ok=True)
+    with open(_report["path"], "w") as report_file:
+        json.dump(report, report_file, indent=2)
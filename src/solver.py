@@ -0,0 +1,212 @@
+import logging
+import time
+
+import numpy as np
+import pulp
+
+from profiling import count, timer
+
+try:
+    import highspy
+except ImportError:
+    # HiGHS is optional, problems are solved with PuLP's CBC then
+    highspy = None
+
+
+# Backend for solving ILP problems: "cbc" (PuLP's CBC in a subprocess) or "highs" (in-process, needs highspy)
+ILP_SOLVER = "cbc"
+
+# Limits per solve (None for no limit): after the time limit (in seconds) or once the relative gap between the best
+# solution and bound is reached, the best solution found so far is used
+ILP_TIME_LIMIT = None
+ILP_GAP = None
+
+# Threads used by the solver per solve
+ILP_THREADS = 1
+
+# Status of a solve with its solution being usable (HiGHS reports reaching the gap as optimal)
+USABLE_STATUSES = ("Optimal", "Time limit reached", "Gap reached")
+
+
+def _set_initial_values(prob, initial_values):
+    """
+    Set the initial values of the variables of a problem for a warm start with CBC (only supported by newer PuLP
+    versions)
+
+    :param prob: problem to solve
+    :type prob: pulp.LpProblem
+    :param initial_values: values of (some of) the variables by name
+    :type initial_values: dict[str, float]
+    :return: True if the values could be set
+    :rtype: bool
+    """
+    if not hasattr(pulp.LpVariable, "setInitialValue"):
+        return False
+    for variable in prob.variables():
+        if variable.name in initial_values:
+            variable.setInitialValue(initial_values[variable.name])
+    return True
+
+
+def _solve_cbc(prob, initial_values, time_limit, gap, threads):
+    """
+    Solve a problem with PuLP's CBC
+
+    :param prob: problem to solve (the values of its variables are set)
+    :type prob: pulp.LpProblem
+    :param initial_values: values of (some of) the variables by name for a warm start (None for no warm start)
+    :type initial_values: dict[str, float]
+    :param time_limit: time limit in seconds (None for no limit)
+    :type time_limit: float
+    :param gap: relative gap to stop at (None for no gap)
+    :type gap: float
+    :param threads: number of threads
+    :type threads: int
+    :return: status of the solve
+    :rtype: str
+    """
+    options = {"msg": 0, "maxSeconds": time_limit, "fracGap": gap, "threads": threads}
+    if initial_values is not None and _set_initial_values(prob, initial_values):
+        options["warmStart"] = True
+    prob.solve(pulp.PULP_CBC_CMD(**options))
+
+    status = pulp.LpStatus[prob.status]
+    if status == "Not Solved" and all(variable.varValue is not None for variable in prob.variables()):
+        # CBC stopped at a limit with a feasible solution
+        return "Time limit reached" if time_limit is not None else "Gap reached"
+    return status
+
+
+def _solve_highs(prob, initial_values, time_limit, gap, threads):
+    """
+    Solve a problem in-process with HiGHS
+
+    :param prob: problem to solve (the values of its variables are set)
+    :type prob: pulp.LpProblem
+    :param initial_values: values of (some of) the variables by name for a warm start (None for no warm start)
+    :type initial_values: dict[str, float]
+    :param time_limit: time limit in seconds (None for no limit)
+    :type time_limit: float
+    :param gap: relative gap to stop at (None for no gap)
+    :type gap: float
+    :param threads: number of threads
+    :type threads: int
+    :return: status of the solve
+    :rtype: str
+    """
+    variables = prob.variables()
+    positions = {variable.name: i for i, variable in enumerate(variables)}
+    objective = prob.objective if prob.objective is not None else pulp.LpAffineExpression()
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = len(variables)
+    lp.col_cost_ = np.array([objective.get(variable, 0) for variable in variables], dtype=np.float64)
+    lp.col_lower_ = np.array([variable.lowBound if variable.lowBound is not None else -highspy.kHighsInf
+                              for variable in variables], dtype=np.float64)
+    lp.col_upper_ = np.array([variable.upBound if variable.upBound is not None else highspy.kHighsInf
+                              for variable in variables], dtype=np.float64)
+    lp.integrality_ = [highspy.HighsVarType.kInteger if variable.cat == pulp.LpInteger else highspy.HighsVarType.kContinuous
+                       for variable in variables]
+    lp.offset_ = objective.constant
+    lp.sense_ = highspy.ObjSense.kMaximize if prob.sense == pulp.LpMaximize else highspy.ObjSense.kMinimize
+
+    # Constraints are stored row-wise as expression + constant (sense) 0
+    row_lower, row_upper, starts, indices, values = [], [], [0], [], []
+    for constraint in prob.constraints.values():
+        for variable, coefficient in constraint.items():
+            indices.append(positions[variable.name])
+            values.append(coefficient)
+        starts.append(len(indices))
+        bound = -constraint.constant
+        row_lower.append(bound if constraint.sense in [pulp.LpConstraintGE, pulp.LpConstraintEQ] else -highspy.kHighsInf)
+        row_upper.append(bound if constraint.sense in [pulp.LpConstraintLE, pulp.LpConstraintEQ] else highspy.kHighsInf)
+    lp.num_row_ = len(row_lower)
+    lp.row_lower_ = np.array(row_lower, dtype=np.float64)
+    lp.row_upper_ = np.array(row_upper, dtype=np.float64)
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_ = np.array(starts, dtype=np.int32)
+    lp.a_matrix_.index_ = np.array(indices, dtype=np.int32)
+    lp.a_matrix_.value_ = np.array(values, dtype=np.float64)
+
+    highs = highspy.Highs()
+    highs.setOptionValue("output_flag", False)
+    highs.setOptionValue("threads", threads)
+    if time_limit is not None:
+        highs.setOptionValue("time_limit", float(time_limit))
+    if gap is not None:
+        highs.setOptionValue("mip_rel_gap", float(gap))
+    highs.passModel(lp)
+
+    if initial_values is not None:
+        solution = highspy.HighsSolution()
+        solution.col_value = [initial_values.get(variable.name, 0) for variable in variables]
+        solution.value_valid = True
+        highs.setSolution(solution)
+
+    highs.run()
+    model_status = highs.getModelStatus()
+    has_solution = highs.getInfo().primal_solution_status == 2
+    column_values = highs.getSolution().col_value if has_solution else [None] * len(variables)
+    for variable, value in zip(variables, column_values):
+        variable.varValue = round(value) if value is not None and variable.cat == pulp.LpInteger else value
+
+    # A model without columns (e.g., no relevant sentences) is solved trivially
+    if model_status in [highspy.HighsModelStatus.kOptimal, highspy.HighsModelStatus.kModelEmpty]:
+        return "Optimal"
+    if model_status == highspy.HighsModelStatus.kInfeasible:
+        return "Infeasible"
+    if model_status == highspy.HighsModelStatus.kUnbounded:
+        return "Unbounded"
+    if has_solution and model_status == highspy.HighsModelStatus.kTimeLimit:
+        return "Time limit reached"
+    return highs.modelStatusToString(model_status)
+
+
+def solve(prob, name, initial_values=None, solver=None, time_limit=None, gap=None, threads=None):
+    """
+    Solve a problem with the configured backend and limits and record the status and time of the solve
+
+    If a limit is reached, the variables hold the best solution found so far. The time and status are recorded with
+    the profiling timers and counters.
+
+    :param prob: problem to solve (the values of its variables are set)
+    :type prob: pulp.LpProblem
+    :param name: name of the problem (for the recorded counters)
+    :type name: str
+    :param initial_values: values of (some of) the variables by name for a warm start (None for no warm start)
+    :type initial_values: dict[str, float]
+    :param solver: backend ("highs" or "cbc", defaults to ILP_SOLVER)
+    :type solver: str
+    :param time_limit: time limit in seconds (defaults to ILP_TIME_LIMIT)
+    :type time_limit: float
+    :param gap: relative gap to stop at (defaults to ILP_GAP)
+    :type gap: float
+    :param threads: number of threads (defaults to ILP_THREADS)
+    :type threads: int
+    :return: status of the solve ("Optimal", "Time limit reached", "Gap reached" or a status without solution)
+    :rtype: str
+    """
+    solver = solver if solver is not None else ILP_SOLVER
+    time_limit = time_limit if time_limit is not None else ILP_TIME_LIMIT
+    gap = gap if gap is not None else ILP_GAP
+    threads = threads if threads is not None else ILP_THREADS
+
+    start = time.perf_counter()
+    with timer("solver"):
+        if solver == "highs":
+            if highspy is None:
+                raise ValueError("The highs solver needs the highspy package")
+            status = _solve_highs(prob, initial_values, time_limit, gap, threads)
+        elif solver == "cbc":
+            status = _solve_cbc(prob, initial_values, time_limit, gap, threads)
+        else:
+            raise ValueError(f"Unknown solver {solver}")
+    seconds = time.perf_counter() - start
+
+    count(f"{name}_solves")
+    count(f"{name}_status_{status.lower().replace(' ', '_')}")
+    if status not in USABLE_STATUSES:
+        logging.warning(f"Solving {name} failed after {seconds:.2f}s: {status}")
+    else:
+        logging.debug(f"Solved {name} in {seconds:.2f}s: {status}")
+    return status
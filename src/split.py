@@ -1,105 +1,231 @@
 import json
 import os
 import sys
-from os import path, listdir
+from hashlib import blake2b
+from os import path
 
 import random
 
 from math import ceil
 
 from parse_dump import get_base_path
+from topic_index import load_topic_index
 
 SPLIT_TEST = 0.1
 SPLIT_VAL = 0.1
 
+# How topics are assigned to the splits: "shuffle" (shuffle all topics in the order the label files are listed with
+# a fixed seed, only reproducible for the same listing order, and adding or removing a single topic changes the split
+# of most other topics) or "hash" (by a hash of the split key of each topic, topics keep their split when the corpus
+# is refreshed)
+SPLIT_ASSIGNMENT = "shuffle"
 
-def split(wiki_name, experiment, threshold=0):
+# Information of a topic (in the topic index) whose hash assigns it to a split: "query" or "source_doc_names" (the
+# topic ids are not stable as topics are numbered in the order in which they were found)
+SPLIT_KEY = "query"
+
+# How the files of a split are made available in its folders: "symlink", "hardlink" (both in a split folder within
+# each output folder) or "manifest" (only the json manifest listing the files of each split is written)
+SPLIT_LINK_MODE = "symlink"
+
+# Output folders of an experiment with the extension of their files
+_SPLIT_FOLDERS = [("inputs", ".json"), ("labels-concept-based", ".json"), ("labels-sentence-based", ".json"),
+                  ("human-abstracts", ".1.txt"), ("extractive-concept-based", ".1.txt"),
+                  ("extractive-sentence-based", ".1.txt")]
+
+
+def _is_linked(source_path, link_path, link_mode):
+    """
+    Check whether a link already points to its source
+
+    :param source_path: path of the linked file
+    :type source_path: str
+    :param link_path: path of the link
+    :type link_path: str
+    :param link_mode: kind of link ("symlink" or "hardlink")
+    :type link_mode: str
+    :return: True if the link exists and points to the source
+    :rtype: bool
+    """
+    if link_mode == "symlink":
+        return path.islink(link_path) and os.readlink(link_path) == path.relpath(source_path, path.dirname(link_path))
+    return path.exists(link_path) and not path.islink(link_path) and path.samefile(source_path, link_path)
+
+
+def _link_split_folder(source_folder, split_folder, file_names, link_mode):
+    """
+    Make the folder of a split link exactly the given files of an output folder
+
+    Links that are already correct are kept and links of files no longer in the split are removed, so running this
+    again only touches the files that changed.
+
+    :param source_folder: output folder with the files
+    :type source_folder: str
+    :param split_folder: folder of the split
+    :type split_folder: str
+    :param file_names: names of the files in the split (files missing in the output folder are skipped)
+    :type file_names: list[str]
+    :param link_mode: kind of link ("symlink" or "hardlink")
+    :type link_mode: str
+    """
+    os.makedirs(split_folder, exist_ok=True)
+    wanted = set(file_names)
+    for file_name in os.listdir(split_folder):
+        if file_name not in wanted:
+            os.remove(path.join(split_folder, file_name))
+
+    for file_name in file_names:
+        source_path = path.join(source_folder, file_name)
+        link_path = path.join(split_folder, file_name)
+        # Inputs may only be stored in the packed corpus
+        if not path.exists(source_path):
+            if path.lexists(link_path):
+                os.remove(link_path)
+            continue
+        if _is_linked(source_path, link_path, link_mode):
+            continue
+        if path.lexists(link_path):
+            os.remove(link_path)
+        if link_mode == "symlink":
+            os.symlink(path.relpath(source_path, split_folder), link_path)
+        else:
+            os.link(source_path, link_path)
+
+
+def _get_split_position(entry, split_key):
+    """
+    Get a stable position of a topic in [0, 1) from the hash of its split key
+
+    :param entry: entry of the topic in the topic index
+    :type entry: dict[str]
+    :param split_key: information of the topic to hash
+    :type split_key: str
+    :return: position of the topic
+    :rtype: float
+    """
+    key = entry[split_key]
+    # Lists (like the source document names, taken from a set) are hashed independent of their order
+    if isinstance(key, list):
+        key = sorted(key)
+    digest = blake2b(json.dumps(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+def _split_files(files, positions, threshold, assignment):
+    """
+    Split files into test, validation and train set
+
+    :param files: files to split (shuffled in place when shuffling)
+    :type files: list[str]
+    :param positions: stable positions of the files (see _get_split_position), only needed when hashing
+    :type positions: dict[str, float]
+    :param threshold: threshold of the split (for the split names)
+    :type threshold: int
+    :param assignment: "shuffle" or "hash"
+    :type assignment: str
+    :return: name and files of every split
+    :rtype: list[(str, list[str])]
+    """
+    if assignment == "hash":
+        test_files = [file for file in files if positions[file] < SPLIT_TEST]
+        val_files = [file for file in files if SPLIT_TEST <= positions[file] < SPLIT_TEST + SPLIT_VAL]
+        train_files = [file for file in files if positions[file] >= SPLIT_TEST + SPLIT_VAL]
+    else:
+        # Shuffle files to get a balanced split
+        random.seed(42)
+        random.shuffle(files)
+
+        split_test_val = ceil(len(files) * SPLIT_TEST)
+        split_val_train = ceil(len(files) * (SPLIT_TEST + SPLIT_VAL))
+        test_files = files[:split_test_val]
+        val_files = files[split_test_val:split_val_train]
+        train_files = files[split_val_train:]
+
+    return [(f'test-{str(threshold)}', test_files),
+            (f'valid-{str(threshold)}', val_files),
+            (f'train-{str(threshold)}', train_files)]
+
+
+def split(wiki_name, experiment, thresholds=0, link_mode=None, assignment=None, split_key=None):
     """
     Split available files into train, validation and test set
 
+    All thresholds are split from a single read of the topic index. When hashing, every topic is assigned by the hash
+    of its split key, so a refresh of the corpus only changes the split of added or removed topics. Running the split
+    again is idempotent: existing links are checked and only missing or outdated ones are changed.
+
     :param wiki_name: name of the wikia dump to parse
     :type wiki_name: str
     :param experiment: name of the experiment to load the data for
     :type experiment: str
-    :param threshold: if higher than 0, only files with sentence-based threshold over given threshold are considered
-    :type threshold: int
+    :param thresholds: threshold or list of thresholds to split for, if higher than 0, only files with sentence-based
+        threshold over given threshold are considered
+    :type thresholds: int | list[int]
+    :param link_mode: "symlink", "hardlink" or "manifest" (defaults to SPLIT_LINK_MODE)
+    :type link_mode: str
+    :param assignment: "shuffle" or "hash" (defaults to SPLIT_ASSIGNMENT)
+    :type assignment: str
+    :param split_key: information of a topic to hash when hashing (defaults to SPLIT_KEY)
+    :type split_key: str
     """
-    # Base paths
+    if isinstance(thresholds, int):
+        thresholds = [thresholds]
+    link_mode = link_mode if link_mode is not None else SPLIT_LINK_MODE
+    if link_mode not in ["symlink", "hardlink", "manifest"]:
+        raise ValueError(f"Unknown link mode {link_mode}")
+    assignment = assignment if assignment is not None else SPLIT_ASSIGNMENT
+    if assignment not in ["shuffle", "hash"]:
+        raise ValueError(f"Unknown split assignment {assignment}")
+    split_key = split_key if split_key is not None else SPLIT_KEY
+
     path_experiment = path.abspath(path.join(get_base_path(wiki_name), experiment))
-    path_inputs = path.join(path_experiment, "inputs")
-    path_labels_concept_based = path.join(path_experiment, "labels-concept-based")
-    path_labels_sentence_based = path.join(path_experiment, "labels-sentence-based")
-    path_human_abstracts = path.join(path_experiment, "human-abstracts")
-    path_extractive_concept_based = path.join(path_experiment, "extractive-concept-based")
-    path_extractive_sentence_based = path.join(path_experiment, "extractive-sentence-based")
-
-    # List of all topics of this corpus
-    files = []
-    for f in listdir(path_labels_concept_based):
-        if f.endswith(".json"):
-            with open(path.join(path_labels_sentence_based, f), 'r') as label_file:
-                label_info = json.load(label_file)
-            if label_info["score"] is not None and label_info["score"] >= threshold and label_info["length"] > 0:
-                files.append(f)
-
-    split_info = {"name": wiki_name, "size": len(files), "files": files, "splits": []}
-
-    # Shuffle files to get a balanced split
-    random.seed(42)
-    random.shuffle(files)
-
-    # Generate splits based upon configuration
-    split_test_val = ceil(len(files) * SPLIT_TEST)
-    split_val_train = ceil(len(files) * (SPLIT_TEST + SPLIT_VAL))
-    splits = [(f'test-{str(threshold)}', files[:split_test_val]),
-              (f'valid-{str(threshold)}', files[split_test_val:split_val_train]),
-              (f'train-{str(threshold)}', files[split_val_train:])]
-
-    # For every split...
-    for split_name, split_files in splits:
-        # ... determine paths and create folders...
-        split_path_inputs = path.join(path_inputs, split_name)
-        os.makedirs(split_path_inputs, exist_ok=True)
-        split_path_labels_concept_based = path.join(path_labels_concept_based, split_name)
-        os.makedirs(split_path_labels_concept_based, exist_ok=True)
-        split_path_labels_sentence_based = path.join(path_labels_sentence_based, split_name)
-        os.makedirs(split_path_labels_sentence_based, exist_ok=True)
-        split_path_human_abstracts = path.join(path_human_abstracts, split_name)
-        os.makedirs(split_path_human_abstracts, exist_ok=True)
-        split_path_extractive_concept_based = path.join(path_extractive_concept_based, split_name)
-        os.makedirs(split_path_extractive_concept_based, exist_ok=True)
-        split_path_extractive_sentence_based = path.join(path_extractive_sentence_based, split_name)
-        os.makedirs(split_path_extractive_sentence_based, exist_ok=True)
-
-        # Add info to json
-        split_info["splits"].append({"name": split_name, "size": len(split_files), "files": split_files})
-
-        # ... and create symlinks for all affected files
-        for file in split_files:
-            os.symlink(path.relpath(path.join(path_inputs, file), split_path_inputs),
-                       path.join(split_path_inputs, file))
-            os.symlink(path.relpath(path.join(path_labels_concept_based, file), split_path_labels_concept_based),
-                       path.join(split_path_labels_concept_based, file))
-            os.symlink(path.relpath(path.join(path_labels_sentence_based, file), split_path_labels_sentence_based),
-                       path.join(split_path_labels_sentence_based, file))
-            fileid_ref = file[:-5] + ".1.txt"
-            os.symlink(path.relpath(path.join(path_human_abstracts, fileid_ref), split_path_human_abstracts),
-                       path.join(split_path_human_abstracts, fileid_ref))
-            os.symlink(path.relpath(path.join(path_extractive_concept_based, fileid_ref), split_path_extractive_concept_based),
-                       path.join(split_path_extractive_concept_based, fileid_ref))
-            os.symlink(path.relpath(path.join(path_extractive_sentence_based, fileid_ref), split_path_extractive_sentence_based),
-                       path.join(split_path_extractive_sentence_based, fileid_ref))
-
-    with open(path.join(path_experiment, f"{wiki_name}.split.{str(threshold)}.json"), 'w') as split_info_file:
-        json.dump(split_info, split_info_file, indent=2)
+
+    # All topics of this corpus
+    topic_index = load_topic_index(wiki_name, experiment)
+    positions = {}
+    if assignment == "hash":
+        positions = {entry["id"] + ".json": _get_split_position(entry, split_key) for entry in topic_index}
+    else:
+        # The seeded shuffle depends on the order of the topics, keep the order in which the label files are listed
+        # (as before the topic index) so existing splits are reproduced
+        entries = {entry["id"] + ".json": entry for entry in topic_index}
+        topic_index = [entries[file] for file in os.listdir(path.join(path_experiment, "labels-concept-based"))
+                       if file in entries]
+
+    for threshold in thresholds:
+        files = []
+        for entry in topic_index:
+            score = entry["score_sentence_based"]
+            if score is not None and score >= threshold and entry["length_sentence_based"] > 0:
+                files.append(entry["id"] + ".json")
+
+        split_info = {"name": wiki_name, "size": len(files), "files": files, "splits": []}
+
+        splits = _split_files(files, positions, threshold, assignment)
+
+        # For every split add info to json and link all affected files
+        for split_name, split_files in splits:
+            split_info["splits"].append({"name": split_name, "size": len(split_files), "files": split_files})
+            if link_mode == "manifest":
+                continue
+            for folder, extension in _SPLIT_FOLDERS:
+                source_folder = path.join(path_experiment, folder)
+                # No inputs folder is written if the inputs are only stored in the packed corpus
+                if not path.isdir(source_folder):
+                    continue
+                _link_split_folder(source_folder, path.join(source_folder, split_name),
+                                   [file[:-5] + extension for file in split_files], link_mode)
+
+        with open(path.join(path_experiment, f"{wiki_name}.split.{str(threshold)}.json"), 'w') as split_info_file:
+            json.dump(split_info, split_info_file, indent=2)
 
 
 if __name__ == "__main__":
     wiki_name = sys.argv[1]
     experiment = sys.argv[2]
     if len(sys.argv) > 3:
-        threshold = int(sys.argv[3])
+        thresholds = [int(threshold) for threshold in sys.argv[3:]]
     else:
-        threshold = 0
+        thresholds = [0]
 
-    split(wiki_name, experiment, threshold)
+    split(wiki_name, experiment, thresholds)
@@ -0,0 +1,137 @@
+import json
+import sys
+from os import path, listdir
+
+from packed_corpus import PackedCorpus, get_packed_path
+from parse_dump import get_base_path
+
+
+TOPIC_INDEX_FILE = "topic_index.jsonl"
+
+# Information of the input of a topic kept in the index
+_INPUT_KEYS = ["query", "target_length", "overlap", "source_doc_count", "source_overall_length", "source_doc_names"]
+
+
+def get_topic_index_path(wiki_name, experiment):
+    """
+    Get the path of the topic index of an experiment
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param experiment: name of the experiment
+    :type experiment: str
+    :return: path of the topic index
+    :rtype: str
+    """
+    return path.join(get_base_path(wiki_name), experiment, TOPIC_INDEX_FILE)
+
+
+def _get_topic_entry(input_info, labels_infos):
+    """
+    Get the index entry of a topic
+
+    :param input_info: input information of the topic (like written to inputs/, the sentences are not needed)
+    :type input_info: dict[str]
+    :param labels_infos: labels information of the topic (like written to labels-*/) by kind of labels
+    :type labels_infos: dict[str, dict[str]]
+    :return: index entry with the id, input information, scores and lengths of the topic
+    :rtype: dict[str]
+    """
+    entry = {"id": input_info["id"]}
+    entry.update({key: input_info[key] for key in _INPUT_KEYS})
+    for kind, labels_info in labels_infos.items():
+        entry["score_" + kind] = labels_info["score"]
+        entry["length_" + kind] = labels_info["length"]
+    return entry
+
+
+class TopicIndexWriter:
+    """
+    Writer for the topic index: one json line with the metadata (scores, lengths, overlap, ...) per topic, so later
+    stages do not have to read the label and input files of all topics
+    """
+
+    def __init__(self, index_path):
+        """
+        :param index_path: path of the topic index (an existing index is replaced)
+        :type index_path: str
+        """
+        self._index_file = open(index_path, "w")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_topic(self, input_info, labels_infos):
+        """
+        Add a topic (and flush it, so an interrupted run keeps the index of all written topics)
+
+        :param input_info: input information of the topic (like written to inputs/)
+        :type input_info: dict[str]
+        :param labels_infos: labels information of the topic (like written to labels-*/) by kind of labels
+        :type labels_infos: dict[str, dict[str]]
+        """
+        self._index_file.write(json.dumps(_get_topic_entry(input_info, labels_infos)) + "\n")
+        self._index_file.flush()
+
+    def close(self):
+        self._index_file.close()
+
+
+def build_topic_index(wiki_name, experiment):
+    """
+    Build the topic index of an experiment from its label and input files (or its packed corpus), for experiments
+    assigned before the index was written
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param experiment: name of the experiment
+    :type experiment: str
+    """
+    path_experiment = path.join(get_base_path(wiki_name), experiment)
+    path_inputs = path.join(path_experiment, "inputs")
+    packed_path = get_packed_path(wiki_name, experiment)
+    packed_corpus = PackedCorpus(packed_path) if path.exists(path.join(packed_path, "topics.jsonl")) else None
+
+    with TopicIndexWriter(get_topic_index_path(wiki_name, experiment)) as writer:
+        for file in sorted(listdir(path.join(path_experiment, "labels-concept-based"))):
+            if not file.endswith(".json"):
+                continue
+            topic_id = file[:-5]
+            labels_infos = {}
+            for kind in ["concept_based", "sentence_based"]:
+                with open(path.join(path_experiment, "labels-" + kind.replace("_", "-"), file), "r") as labels_file:
+                    labels_infos[kind] = json.load(labels_file)
+            if packed_corpus is not None and topic_id in packed_corpus:
+                input_info = packed_corpus.topics[topic_id]
+            else:
+                with open(path.join(path_inputs, file), "r") as input_file:
+                    input_info = json.load(input_file)
+            writer.add_topic(input_info, labels_infos)
+
+
+def load_topic_index(wiki_name, experiment):
+    """
+    Load the topic index of an experiment (it is built first if it does not exist yet)
+
+    :param wiki_name: name of the wiki
+    :type wiki_name: str
+    :param experiment: name of the experiment
+    :type experiment: str
+    :return: index entries of all topics (see _get_topic_entry)
+    :rtype: list[dict[str]]
+    """
+    index_path = get_topic_index_path(wiki_name, experiment)
+    if not path.exists(index_path):
+        build_topic_index(wiki_name, experiment)
+    with open(index_path, "r") as index_file:
+        return [json.loads(line) for line in index_file]
+
+
+if __name__ == "__main__":
+    wiki_name = sys.argv[1]
+    experiment = sys.argv[2] if len(sys.argv) > 2 else 'qf-mds'
+
+    build_topic_index(wiki_name, experiment)